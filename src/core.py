@@ -1,30 +1,87 @@
 # core.py
 import json
 import os
+import bisect
 import importlib
-import glob
-from datetime import datetime, timedelta
+import inspect
+from datetime import datetime, timedelta, timezone
 import logging
-import traceback
 import re
+import threading
 import time
 import random
-from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from events import MessageEmitter
+import database
 
 # Import config from our new utils file
-from utils import DEFAULT_CONFIG
+from utils import DEFAULT_CONFIG, dumps_bytes, loads
 
 logger = logging.getLogger(__name__)
 
+_WORD_RE = re.compile(r'\w+')
+
+def _term_frequencies(text):
+    """Count word tokens in text, returning (term -> count, total tokens)"""
+    tf = {}
+    for token in _WORD_RE.findall(text.lower()):
+        tf[token] = tf.get(token, 0) + 1
+    return tf, sum(tf.values())
+
+def _alternation(*patterns):
+    """Compile single-payload patterns into one regex; the payload is match.group(match.lastindex)"""
+    return re.compile("|".join(f"(?:{p})" for p in patterns))
+
+# Knowledge extractors, tried in order: (name, compiled pattern, AIChatBot handler method)
+_KNOWLEDGE_EXTRACTORS = (
+    ("negation_like", _alternation(
+        r"i don't like to ([\w\s]+)", r"i don't like ([\w\s]+ing)", r"i no longer like to ([\w\s]+)",
+        r"i no longer enjoy ([\w\s]+ing)", r"i stopped liking ([\w\s]+ing)"), "_learn_negation_like"),
+    ("negation_love", _alternation(
+        r"i don't love ([\w\s]+)", r"i don't prefer ([\w\s]+)", r"i no longer love ([\w\s]+)",
+        r"i stopped loving ([\w\s]+)"), "_learn_negation_love"),
+    ("name", _alternation(r"my name is ([\w\s]+)", r"i am ([\w\s]+)", r"call me ([\w\s]+)"), "_learn_name"),
+    ("like", _alternation(r"i like to ([\w\s]+)", r"i like ([\w\s]+ing)", r"i enjoy ([\w\s]+ing)"), "_learn_like"),
+    ("hobby", _alternation(r"my hobby is ([\w\s]+)", r"my hobby is now ([\w\s]+)"), "_learn_hobby"),
+    ("love", _alternation(r"i love ([\w\s]+)", r"i prefer ([\w\s]+)"), "_learn_love"),
+    ("general_fact", re.compile(r"my (\w+) is ([\w\s]+)"), "_learn_general_fact"),
+)
+
+# Greetings and acknowledgements that knowledge extraction and context matching can't use
+_TRIVIAL_RE = re.compile(r'^\s*(hi|hello|hey|ok|okay|yes|no|yep|nope|bye|thanks|thx|lol)\b')
+
+# Conversational intents, tried in order: (name, compiled pattern, AIChatBot handler method)
+_INTENTS = (
+    ("greeting", re.compile(r"^\b(hi|hello|hey)\b"), "_reply_greeting"),
+    ("status_check", re.compile(r"\bhow are you\b"), "_reply_status_check"),
+    ("sentiment", re.compile(r"\b(sad|upset|down|happy|great|awesome|tired|exhausted)\b"), "_reply_sentiment"),
+    ("query_bot_name", re.compile(r"\bwhat is your name\b|\bwhat's your name\b"), "_reply_bot_name"),
+    ("query_user_name", re.compile(r"\bwhat is my name\b|\bwhat's my name\b"), "_reply_user_name"),
+    ("farewell", re.compile(r"^\b(bye|goodbye|see ya)\b"), "_reply_farewell"),
+)
+
+# Sentiment words recognised by the "sentiment" intent, and the reply for each category
+_SENTIMENT_MAP = {"sad": "sad", "upset": "sad", "down": "sad", "happy": "happy", "great": "happy", "awesome": "happy", "tired": "tired", "exhausted": "tired"}
+_SENTIMENT_TEMPLATES = {
+    "sad": "I'm sorry to hear you're feeling down, {name}. Is there anything I can do to help?",
+    "happy": "That's wonderful to hear, {name}! What's making you so happy?",
+    "tired": "It sounds like you need a rest, {name}. Make sure to take a break and recharge."
+}
+
 class CommandRegistry:
     """Manages bot commands"""
     def __init__(self):
         self.commands = {}
     
     def register(self, name, handler, description="No description provided"):
-        """Register a command with its handler and description"""
-        self.commands[name] = {"handler": handler, "description": description}
+        """Register a command with its handler and description.
+
+        Bound methods are called as handler(args); plain functions as handler(bot, args).
+        """
+        self.commands[name] = {"handler": handler, "description": description, "bound": inspect.ismethod(handler)}
     
     def get_help(self):
         """Generate help text for all commands"""
@@ -33,7 +90,8 @@ class CommandRegistry:
     def execute(self, command, args, bot):
         """Execute a command with arguments"""
         if command in self.commands:
-            return self.commands[command]["handler"](bot, args)
+            info = self.commands[command]
+            return info["handler"](args) if info["bound"] else info["handler"](bot, args)
         return "Unknown command"
 
 class PluginManager:
@@ -42,42 +100,60 @@ class PluginManager:
         self.bot = bot
         self.plugin_dir = plugin_dir
         self.plugins = {}
+        self._modules = {}  # Imported plugin modules, kept so reloads can importlib.reload them
+        self.command_index = {}  # "!command" name -> plugin that declared it in metadata["commands"]
+        self.open_plugins = []  # Plugins that declare no commands and see every message
+        self.catch_all_plugins = []  # Plugins offered free text: open plugins plus those with metadata["catch_all"]
     
     def load_plugins(self):
         """Load all plugins from plugin directory"""
         if not os.path.exists(self.plugin_dir):
             os.makedirs(self.plugin_dir)
         
-        plugin_files = glob.glob(f"{self.plugin_dir}/*.py")
-        for plugin_file in plugin_files:
-            plugin_name = os.path.basename(plugin_file).replace('.py', '')
+        with os.scandir(self.plugin_dir) as entries:
+            plugin_names = sorted(
+                entry.name[:-3] for entry in entries
+                if entry.name.endswith(".py") and entry.is_file()
+            )
+        # Once per pass, so plugin files added since the last import are found
+        importlib.invalidate_caches()
+        for plugin_name in plugin_names:
             if plugin_name != "__init__":
                 self.load_plugin(plugin_name)
     
     def load_plugin(self, plugin_name):
         """Load a single plugin"""
         try:
-            # Invalidate caches to ensure reloading works correctly
-            importlib.invalidate_caches()
             module_name = f"{self.plugin_dir}.{plugin_name}"
-            # If the module is already loaded, reload it
-            if module_name in locals():
-                 module = importlib.reload(locals()[module_name])
+            # If the module was imported before, reload it so code changes are picked up
+            if plugin_name in self._modules:
+                module = importlib.reload(self._modules[plugin_name])
             else:
-                 module = importlib.import_module(module_name)
+                module = importlib.import_module(module_name)
+                self._modules[plugin_name] = module
             
             plugin_class = getattr(module, 'Plugin', None)
             if plugin_class:
                 plugin_instance = plugin_class(self.bot)
+                metadata = getattr(plugin_instance, 'metadata', {"name": plugin_name, "version": "1.0", "description": "No description"})
                 self.plugins[plugin_name] = {
                     "instance": plugin_instance,
-                    "metadata": getattr(plugin_instance, 'metadata', {"name": plugin_name, "version": "1.0", "description": "No description"})
+                    "metadata": metadata
                 }
+                commands = metadata.get("commands", [])
+                for command in commands:
+                    if command in self.command_index:
+                        logger.warning(f"Command !{command} of {plugin_name} overrides {self.command_index[command]}")
+                    self.command_index[command] = plugin_name
+                if not commands:
+                    self.open_plugins.append(plugin_name)
+                if not commands or metadata.get("catch_all"):
+                    self.catch_all_plugins.append(plugin_name)
                 if hasattr(plugin_instance, 'on_load'):
                     plugin_instance.on_load()
                 logger.info(f"Loaded plugin: {plugin_name}")
         except Exception as e:
-            logger.error(f"Error loading plugin {plugin_name}: {e}\n{traceback.format_exc()}")
+            logger.exception(f"Error loading plugin {plugin_name}: {e}")
     
     def reload_plugins(self):
         """Reload all plugins"""
@@ -92,8 +168,24 @@ class PluginManager:
             if hasattr(plugin, 'on_unload'):
                 plugin.on_unload()
             del self.plugins[plugin_name]
+            self.command_index = {cmd: name for cmd, name in self.command_index.items() if name != plugin_name}
+            if plugin_name in self.open_plugins:
+                self.open_plugins.remove(plugin_name)
+            if plugin_name in self.catch_all_plugins:
+                self.catch_all_plugins.remove(plugin_name)
             logger.info(f"Unloaded plugin: {plugin_name}")
     
+    def run_plugins(self, plugin_names, user_input):
+        """Offer input to the given plugins in order and return the first response"""
+        for plugin_name in plugin_names:
+            try:
+                plugin_response = self.plugins[plugin_name]["instance"].process(user_input, None)
+                if plugin_response is not None:
+                    return plugin_response  # Stop after the first plugin handles the message
+            except Exception as e:
+                logger.exception(f"Plugin {plugin_name} error: {e}")
+        return None
+    
     def get_plugin_info(self):
         """Get information about loaded plugins"""
         return "\n".join([
@@ -102,33 +194,56 @@ class PluginManager:
         ])
 
 class AIChatBot:
-    def __init__(self, config_file="config.json"):
+    response_templates = {
+        "like": ["Noted, you like to {0}!", "Cool, you enjoy {0}!", "Great, {0} sounds fun!"],
+        "hobby": ["Cool, your hobby is {0}!", "Awesome, you love {0}!", "Nice, {0} is a great hobby!"],
+        "love": ["Awesome, you love {0}!", "Sweet, {0} is on your love list!", "Great choice, you love {0}!"],
+        "general": ["Got it, your {0} is {1}!", "Noted, {0} is set to {1}!", "Thanks, I saved your {0} as {1}!"],
+        "negation_like": ["Okay, I removed {0} from your likes!", "Got it, {0} is no longer on your likes list!"],
+        "negation_love": ["Okay, I removed {0} from your loves!", "Got it, {0} is off your loves list!"]
+    }
+
+    def __init__(self, config_file="config.json", emitter=None):
         self.config = self.load_config(config_file)
         self.memory_file = self.config["memory_file"]
         self.plugin_dir = self.config["plugin_dir"]
         self.max_history = self.config["max_history"]
         self.history_days = self.config["history_days"]
+        # Minimum seconds between prune_history() runs from flush_memory()
+        self.save_interval = self.config["save_interval"]
 
         self.history_days = self.config["history_days"]
-        self.emitter = MessageEmitter()
+        self.emitter = emitter if emitter is not None else MessageEmitter()
+        # The scheduler thread waits on this; notify_scheduler_changed() wakes it early
+        self.scheduler_cond = threading.Condition()
+        # Shared by plugins for network calls they can overlap or run ahead of time
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="plugin-io")
+        # One pooled keep-alive session for every plugin, so connections are reused across
+        # them. Most calls run while the user waits for a reply, so only a failed connect
+        # (once) and gateway errors are retried; a read timeout is never repeated
+        self.http = requests.Session()
+        self.http.headers["User-Agent"] = "AI_Assistant_Chatbot/1.0"
+        http_adapter = HTTPAdapter(
+            pool_connections=8, pool_maxsize=16,
+            max_retries=Retry(total=2, connect=1, read=0, backoff_factor=0.3, status_forcelist=(502, 503, 504)),
+        )
+        self.http.mount("https://", http_adapter)
+        self.http.mount("http://", http_adapter)
 
         # Add this line to create the services registry
         self.services = {}        
 
+        # Conversations are stored in SQLite; the memory file only holds knowledge
+        database.init_db(self.config["db_file"])
+        self._dirty = False  # Knowledge changed since the last save
+        self._lowered_input = (None, None)  # (message being processed, its lowercase form)
+        self._last_prune = time.monotonic()  # When the conversations table was last trimmed
+        self._closed = False  # Set by shutdown(); later flushes must not reopen the database
         self.memory = self.load_memory()
         self.command_registry = CommandRegistry()
         self.plugin_manager = PluginManager(self, self.plugin_dir)
         self.plugin_manager.load_plugins()
         self.register_default_commands()
-        
-        self.response_templates = {
-            "like": ["Noted, you like to {0}!", "Cool, you enjoy {0}!", "Great, {0} sounds fun!"],
-            "hobby": ["Cool, your hobby is {0}!", "Awesome, you love {0}!", "Nice, {0} is a great hobby!"],
-            "love": ["Awesome, you love {0}!", "Sweet, {0} is on your love list!", "Great choice, you love {0}!"],
-            "general": ["Got it, your {0} is {1}!", "Noted, {0} is set to {1}!", "Thanks, I saved your {0} as {1}!"],
-            "negation_like": ["Okay, I removed {0} from your likes!", "Got it, {0} is no longer on your likes list!"],
-            "negation_love": ["Okay, I removed {0} from your loves!", "Got it, {0} is off your loves list!"]
-        }
     
     def load_config(self, config_file):
         try:
@@ -138,73 +253,150 @@ class AIChatBot:
                     return {**DEFAULT_CONFIG, **config}
             return DEFAULT_CONFIG
         except Exception as e:
-            logger.error(f"Error loading config: {e}\n{traceback.format_exc()}")
+            logger.exception(f"Error loading config: {e}")
             return DEFAULT_CONFIG
     
     def load_memory(self):
+        memory = {"conversations": self.load_conversations(), "knowledge": {"users": {}}}
+        self.prune_memory(memory)
         try:
             if os.path.exists(self.memory_file):
-                with open(self.memory_file, 'r') as f:
-                    memory = json.load(f)
-                    if not isinstance(memory, dict):
-                        memory = {"conversations": [], "knowledge": {"users": {}}}
-                    if "conversations" not in memory:
-                        memory["conversations"] = []
-                    if "knowledge" not in memory:
-                        memory["knowledge"] = {"users": {}}
-                    if "users" not in memory["knowledge"]:
-                        memory["knowledge"]["users"] = {}
+                with open(self.memory_file, 'rb') as f:
+                    stored = loads(f.read())
+                if isinstance(stored, dict) and isinstance(stored.get("knowledge"), dict):
+                    memory["knowledge"] = stored["knowledge"]
+                    memory["knowledge"].setdefault("users", {})
+                # Older memory files kept the conversation history inline; carry it over once
+                if isinstance(stored, dict) and stored.get("conversations") and not memory["conversations"]:
+                    memory["conversations"] = stored["conversations"][-self.max_history:]
                     self.prune_memory(memory)
-                    logger.info("Memory loaded successfully")
-                    return memory
-            logger.info("No memory file found, initializing new memory")
-            return {"conversations": [], "knowledge": {"users": {}}}
+                    database.add_conversations([self._conversation_row(conv, conv["user_id"]) for conv in memory["conversations"]])
+                logger.info("Memory loaded successfully")
+            else:
+                logger.info("No memory file found, initializing new memory")
         except Exception as e:
-            logger.error(f"Error loading memory: {e}\n{traceback.format_exc()}")
-            return {"conversations": [], "knowledge": {"users": {}}}
+            logger.exception(f"Error loading memory: {e}")
+        return memory
+
+    def load_conversations(self):
+        """Load the most recent `max_history` conversation entries from the database"""
+        return [
+            {"user_id": "bot" if row["role"] == "bot" else row["user_id"], "input": row["text"], "timestamp": row["ts"]}
+            for row in database.get_recent_conversations(self.max_history)
+        ]
+    
+    @staticmethod
+    def _conversation_row(entry, user_id):
+        role = "bot" if entry["user_id"] == "bot" else "user"
+        return (user_id, role, entry["input"], entry["timestamp"])
     
     def save_memory(self):
+        """Persist the knowledge section; conversations are stored in the database"""
         try:
-            self.prune_memory(self.memory)
-            with open(self.memory_file, 'w') as f:
-                json.dump(self.memory, f, indent=2)
+            # Serialize up front so the file is written in one call rather than per token
+            data = dumps_bytes({"knowledge": self.memory["knowledge"]}, indent=True)
+            # Write beside the file and swap it in, so a crash mid-write can't truncate it
+            tmp_file = f"{self.memory_file}.tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_file, self.memory_file)
+            self._dirty = False
         except Exception as e:
-            logger.error(f"Error saving memory: {e}\n{traceback.format_exc()}")
+            logger.exception(f"Error saving memory: {e}")
+    
+    def mark_dirty(self):
+        """Flag knowledge as changed; it is written by the next flush_memory()"""
+        self._dirty = True
+    
+    def flush_memory(self, force=False):
+        """Save memory only if something changed since the last save, and keep the
+        conversations table trimmed at most once per save_interval"""
+        if self._closed:
+            return
+        if self._dirty:
+            self.save_memory()
+        if force or time.monotonic() - self._last_prune >= self.save_interval:
+            self.prune_history()
+    
+    def log_conversation(self, entry):
+        """Append a conversation entry to the in-memory history window"""
+        conversations = self.memory["conversations"]
+        conversations.append(entry)
+        if len(conversations) > self.max_history:
+            del conversations[:-self.max_history]
     
     def prune_memory(self, memory):
-        cutoff_date = datetime.now() - timedelta(days=self.history_days)
-        memory["conversations"] = [
-            conv for conv in memory["conversations"]
-            if datetime.fromisoformat(conv["timestamp"]) >= cutoff_date
-        ][-self.max_history:]
+        # Entries are appended chronologically with ISO-8601 timestamps, which sort
+        # lexicographically, so the cutoff can be found by binary search without parsing
+        cutoff_iso = (datetime.now(timezone.utc) - timedelta(days=self.history_days)).isoformat()
+        conversations = memory["conversations"]
+        first_kept = bisect.bisect_left(conversations, cutoff_iso, key=lambda conv: conv["timestamp"])
+        memory["conversations"] = conversations[first_kept:][-self.max_history:]
+        self.prune_history(cutoff_iso)
+
+    def prune_history(self, cutoff_iso=None):
+        """Limit the conversations table to the last history_days and max_history rows"""
+        if cutoff_iso is None:
+            cutoff_iso = (datetime.now(timezone.utc) - timedelta(days=self.history_days)).isoformat()
+        database.prune_conversations(cutoff_iso, keep=self.max_history)
+        self._last_prune = time.monotonic()
+    
+    def notify_scheduler_changed(self):
+        """Wake the scheduler so it picks up newly added or changed events"""
+        with self.scheduler_cond:
+            self.scheduler_cond.notify_all()
+    
+    def shutdown(self):
+        """Write pending knowledge changes, stop background work and release the database connection.
+        Safe to call more than once (main.py also registers it with atexit)"""
+        if self._closed:
+            return
+        self.flush_memory(force=True)
+        self._closed = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.http.close()
+        database.close_db()
     
     def register_default_commands(self):
-        self.command_registry.register("help", lambda bot, args: bot.command_registry.get_help(), "Show available commands")
-        self.command_registry.register("clear", lambda bot, args: bot.clear_memory(), "Clear conversation history")
-        self.command_registry.register("plugins", lambda bot, args: bot.plugin_manager.get_plugin_info(), "List loaded plugins")
-        self.command_registry.register("reload", lambda bot, args: bot.reload_plugins(), "Reload all plugins")
+        self.command_registry.register("help", self._cmd_help, "Show available commands")
+        self.command_registry.register("clear", self._cmd_clear, "Clear conversation history")
+        self.command_registry.register("plugins", self._cmd_plugins, "List loaded plugins")
+        self.command_registry.register("reload", self._cmd_reload, "Reload all plugins")
         self.command_registry.register("setname", self.set_user_name, "Set your nickname (e.g., !setname Alice)")
         self.command_registry.register("facts", self.list_facts, "List all known facts about you")
         self.command_registry.register("forget", self.forget_fact, "Forget a specific fact (e.g., !forget hobby)")
     
+    def _cmd_help(self, args):
+        return self.command_registry.get_help()
+    
+    def _cmd_clear(self, args):
+        return self.clear_memory()
+    
+    def _cmd_plugins(self, args):
+        return self.plugin_manager.get_plugin_info()
+    
+    def _cmd_reload(self, args):
+        return self.reload_plugins()
+    
     def clear_memory(self):
         self.memory["conversations"] = []
         self.memory["knowledge"] = {"users": {}}
-        self.save_memory()
+        database.clear_conversations()
+        self.mark_dirty()
         return "Conversation history cleared"
     
     def reload_plugins(self):
         self.plugin_manager.reload_plugins()
         return "Plugins reloaded"
     
-    def set_user_name(self, args):
+    def set_user_name(self, args, user_id=None):
+        user_id = user_id or self.config["default_user_id"]
         if not args:
             return "Please provide a nickname (e.g., !setname Alice)"
-        user_id = args[0]
-        self.memory["knowledge"]["users"][user_id] = self.memory["knowledge"]["users"].get(user_id, {})
-        self.memory["knowledge"]["users"][user_id]["name"] = user_id
-        self.save_memory()
-        return f"Name set to {user_id}"
+        name = " ".join(args)
+        self.memory["knowledge"]["users"].setdefault(user_id, {})["name"] = name
+        self.mark_dirty()
+        return f"Name set to {name}"
     
     def list_facts(self, args, user_id=None):
         user_id = user_id or self.config["default_user_id"]
@@ -229,7 +421,7 @@ class AIChatBot:
         user_info = self.memory["knowledge"].get("users", {}).get(user_id, {})
         if fact_key in user_info:
             del user_info[fact_key]
-            self.save_memory()
+            self.mark_dirty()
             return f"Okay, I forgot your {fact_key}!"
         return f"I don't have a {fact_key} for you."
 
@@ -237,100 +429,132 @@ class AIChatBot:
         user_input_lower = user_input.lower().strip()
         self.memory["knowledge"]["users"][user_id] = self.memory["knowledge"]["users"].get(user_id, {})
         user_data = self.memory["knowledge"]["users"][user_id]
-        knowledge_extractors = [
-            {
-                "name": "negation_like",
-                "patterns": [r"i don\'t like to ([\w\s]+)", r"i don\'t like ([\w\s]+ing)", r"i no longer like to ([\w\s]+)", r"i no longer enjoy ([\w\s]+ing)", r"i stopped liking ([\w\s]+ing)"],
-                "handler": lambda data, match: (data.get("likes", []).remove(match.group(1)) or random.choice(self.response_templates["negation_like"]).format(match.group(1))) if match.group(1) in data.get("likes", []) else f"I don't have {match.group(1)} in your likes."
-            },
-            {
-                "name": "negation_love",
-                "patterns": [r"i don\'t love ([\w\s]+)", r"i don\'t prefer ([\w\s]+)", r"i no longer love ([\w\s]+)", r"i stopped loving ([\w\s]+)"],
-                "handler": lambda data, match: (data.get("loves", []).remove(match.group(1)) or random.choice(self.response_templates["negation_love"]).format(match.group(1))) if match.group(1) in data.get("loves", []) else f"I don't have {match.group(1)} in your loves."
-            },
-            {"name": "name", "patterns": [r"my name is ([\w\s]+)", r"i am ([\w\s]+)", r"call me ([\w\s]+)"], "handler": lambda data, match: (data.update({"name": match.group(1).title()}) or f"Got it, your name is {match.group(1).title()}! What's something you enjoy doing?")},
-            {"name": "like", "patterns": [r"i like to ([\w\s]+)", r"i like ([\w\s]+ing)", r"i enjoy ([\w\s]+ing)"], "handler": lambda data, match: ((data.setdefault("likes", [])).append(match.group(1)) if match.group(1) not in data.get("likes", []) else None) or (random.choice(self.response_templates["like"]).format(match.group(1)) + " " + ("What else do you like to do?" if random.random() > 0.5 else f"Why do you enjoy {match.group(1)}?"))},
-            {"name": "hobby", "patterns": [r"my hobby is ([\w\s]+)", r"my hobby is now ([\w\s]+)"], "handler": lambda data, match: (data.update({"hobby": match.group(1)}) or random.choice(self.response_templates["hobby"]).format(match.group(1)) + f" How did you get into {match.group(1)}?")},
-            {"name": "love", "patterns": [r"i love ([\w\s]+)", r"i prefer ([\w\s]+)"], "handler": lambda data, match: ((data.setdefault("loves", [])).append(match.group(1).title()) if match.group(1).title() not in data.get("loves", []) else None) or (random.choice(self.response_templates["love"]).format(match.group(1).title()) + f" Tell me more about why you love {match.group(1).title()}!")},
-            {"name": "general_fact", "patterns": [r"my (\w+) is ([\w\s]+)"], "handler": lambda data, match: (data.update({match.group(1): match.group(2).title()}) or random.choice(self.response_templates["general"]).format(match.group(1), match.group(2).title()) + f" Tell me more about your {match.group(1)}!") if match.group(1) not in ["name", "hobby", "likes", "loves"] else None}
-        ]
-        for extractor in knowledge_extractors:
-            for pattern in extractor["patterns"]:
-                match = re.match(pattern, user_input_lower)
-                if match:
-                    response = extractor["handler"](user_data, match)
-                    if response:
-                        self.save_memory()
-                        return response
+        for name, pattern, handler_name in _KNOWLEDGE_EXTRACTORS:
+            match = pattern.match(user_input_lower)
+            if match:
+                response = getattr(self, handler_name)(user_data, match)
+                if response:
+                    self.mark_dirty()
+                    return response
         return None
+
+    def _learn_negation_like(self, data, match):
+        activity = match.group(match.lastindex)
+        if activity not in data.get("likes", []):
+            return f"I don't have {activity} in your likes."
+        data["likes"].remove(activity)
+        return random.choice(self.response_templates["negation_like"]).format(activity)
+
+    def _learn_negation_love(self, data, match):
+        thing = match.group(match.lastindex)
+        if thing not in data.get("loves", []):
+            return f"I don't have {thing} in your loves."
+        data["loves"].remove(thing)
+        return random.choice(self.response_templates["negation_love"]).format(thing)
+
+    def _learn_name(self, data, match):
+        name = match.group(match.lastindex).title()
+        data["name"] = name
+        return f"Got it, your name is {name}! What's something you enjoy doing?"
+
+    def _learn_like(self, data, match):
+        activity = match.group(match.lastindex)
+        if activity not in data.get("likes", []):
+            data.setdefault("likes", []).append(activity)
+        follow_up = "What else do you like to do?" if random.random() > 0.5 else f"Why do you enjoy {activity}?"
+        return random.choice(self.response_templates["like"]).format(activity) + " " + follow_up
+
+    def _learn_hobby(self, data, match):
+        hobby = match.group(match.lastindex)
+        data["hobby"] = hobby
+        return random.choice(self.response_templates["hobby"]).format(hobby) + f" How did you get into {hobby}?"
+
+    def _learn_love(self, data, match):
+        thing = match.group(match.lastindex).title()
+        if thing not in data.get("loves", []):
+            data.setdefault("loves", []).append(thing)
+        return random.choice(self.response_templates["love"]).format(thing) + f" Tell me more about why you love {thing}!"
+
+    def _learn_general_fact(self, data, match):
+        key = match.group(1)
+        if key in ["name", "hobby", "likes", "loves"]:
+            return None
+        value = match.group(2).title()
+        data[key] = value
+        return random.choice(self.response_templates["general"]).format(key, value) + f" Tell me more about your {key}!"
     
+    def lowered(self, text):
+        """text.lower(), computed once per message however many plugins ask for it"""
+        current, current_lower = self._lowered_input
+        if text is current:
+            return current_lower
+        return text.lower()
+
     def process_message(self, user_input, user_id=None):
         user_id = user_id or self.config["default_user_id"]
-        timestamp = datetime.now().isoformat()
-        self.memory["conversations"].append({"user_id": user_id, "input": user_input, "timestamp": timestamp})
+        # Plugins read this through lowered(); one tuple so a concurrent call can't mix halves
+        self._lowered_input = (user_input, user_input.lower())
+        timestamp = datetime.now(timezone.utc).isoformat()
+        user_entry = {"user_id": user_id, "input": user_input, "timestamp": timestamp}
+        self.log_conversation(user_entry)
         
         response = None
         try:
             # --- REFACTORED LOGIC START ---
             
-            # 1. Give plugins the first chance to process ANY input.
-            # This allows them to handle their own commands (e.g., !todo) or any other text.
-            for plugin_name, plugin_data in self.plugin_manager.plugins.items():
-                try:
-                    plugin_response = plugin_data["instance"].process(user_input, None)
-                    if plugin_response is not None:
-                        response = plugin_response
-                        break  # Stop after the first plugin handles the message
-                except Exception as e:
-                    logger.error(f"Plugin {plugin_name} error: {e}\n{traceback.format_exc()}")
-            
-            # 2. If no plugin handled it, check for core commands (if it's a command).
-            if response is None and user_input.startswith("!"):
+            if user_input.startswith("!"):
                 cmd_parts = user_input[1:].split(maxsplit=1)
-                command = cmd_parts[0].lower()
+                command = cmd_parts[0].lower() if cmd_parts else ""
                 args = cmd_parts[1].split() if len(cmd_parts) > 1 else []
-                response = self.command_registry.execute(command, args, self)
+
+                # 1. Commands go straight to the plugin that declared them (e.g., !todo),
+                # then to plugins that declare no commands at all.
+                plugin_name = self.plugin_manager.command_index.get(command)
+                if plugin_name is not None:
+                    response = self.plugin_manager.run_plugins([plugin_name], user_input)
+                if response is None:
+                    response = self.plugin_manager.run_plugins(self.plugin_manager.open_plugins, user_input)
+
+                # 2. If no plugin handled it, check for core commands.
+                if response is None:
+                    response = self.command_registry.execute(command, args, self)
+            else:
+                # 1. Free text only goes to plugins that opted into it; command-only plugins are skipped.
+                response = self.plugin_manager.run_plugins(self.plugin_manager.catch_all_plugins, user_input)
 
             # 3. If still no response, fall back to knowledge and general conversation.
+            # Short or trivial messages skip straight to the canned replies.
             if response is None:
-                knowledge_response = self.extract_knowledge(user_input, user_id)
+                skip_heavy = len(user_input.split()) < 2 or _TRIVIAL_RE.match(self.lowered(user_input))
+                knowledge_response = None if skip_heavy else self.extract_knowledge(user_input, user_id)
                 if knowledge_response:
                     response = knowledge_response
                 else:
-                    response = self.generate_response(user_input, user_id)
+                    response = self.generate_response(user_input, user_id, use_context=not skip_heavy)
             
             # --- REFACTORED LOGIC END ---
 
         except Exception as e:
-            logger.error(f"Error generating response: {e}\n{traceback.format_exc()}")
+            logger.exception(f"Error generating response: {e}")
             response = "Sorry, I encountered an error. Please try again."
         
-        self.memory["conversations"].append({"user_id": "bot", "input": response, "timestamp": timestamp})
-        self.save_memory()
+        bot_entry = {"user_id": "bot", "input": response, "timestamp": timestamp}
+        self.log_conversation(bot_entry)
+        # Both sides of the turn go to the database in one transaction
+        database.add_conversations([self._conversation_row(user_entry, user_id), self._conversation_row(bot_entry, user_id)])
+        # The single save point for knowledge changed while handling this message
+        self.flush_memory()
         return response
     
-    def generate_response(self, user_input, user_id):
+    def generate_response(self, user_input, user_id, use_context=True):
         user_input_lower = user_input.lower().strip()
         user_info = self.memory["knowledge"].get("users", {}).get(user_id, {})
         name = user_info.get("name", "there")
-        sentiment_responses = {
-            "sad": f"I'm sorry to hear you're feeling down, {name}. Is there anything I can do to help?",
-            "happy": f"That's wonderful to hear, {name}! What's making you so happy?",
-            "tired": f"It sounds like you need a rest, {name}. Make sure to take a break and recharge."
-        }
-        intent_handlers = [
-            {"name": "greeting", "pattern": r"^\b(hi|hello|hey)\b", "handler": lambda ui, m: f"Hello {name}! How can I help you today?" + (f" Thinking of doing some {ui.get('likes')[0]}?" if ui.get("likes") else "")},
-            {"name": "status_check", "pattern": r"\bhow are you\b", "handler": lambda ui, m: f"I'm just a program, but I'm running perfectly! Thanks for asking, {name}." + (f" Are you planning any {ui.get('hobby')} projects soon?" if ui.get("hobby") else "")},
-            {"name": "sentiment", "pattern": r"\b(sad|upset|down|happy|great|awesome|tired|exhausted)\b", "handler": lambda ui, m: sentiment_responses.get({"sad": "sad", "upset": "sad", "down": "sad", "happy": "happy", "great": "happy", "awesome": "happy", "tired": "tired", "exhausted": "tired"}.get(m.group(1)), f"I see you're feeling {m.group(1)}, {name}.")},
-            {"name": "query_bot_name", "pattern": r"\bwhat is your name\b|\bwhat's your name\b", "handler": lambda ui, m: "You can call me Gemini. And you are " + (name if name != "there" else "...") + "?"},
-            {"name": "query_user_name", "pattern": r"\bwhat is my name\b|\bwhat's my name\b", "handler": lambda ui, m: f"Your name is {name}." if name != "there" else "I don't know your name yet. What should I call you?"},
-            {"name": "farewell", "pattern": r"^\b(bye|goodbye|see ya)\b", "handler": lambda ui, m: f"Goodbye, {name}! Talk to you later."}
-        ]
-        for intent in intent_handlers:
-            match = re.search(intent["pattern"], user_input_lower)
+        for intent_name, pattern, handler_name in _INTENTS:
+            match = pattern.search(user_input_lower)
             if match:
-                return intent["handler"](user_info, match)
-        if len(user_input_lower.split()) > 1 and not user_input_lower.endswith("?"):
+                return getattr(self, handler_name)(user_info, match, name)
+        if use_context and len(user_input_lower.split()) > 1 and not user_input_lower.endswith("?"):
             context = self.get_relevant_context(user_input, user_id)
             if context:
                 return f"That reminds me of when you said: '{context}'. Can you tell me more?"
@@ -342,25 +566,55 @@ class AIChatBot:
         ]
         return random.choice(default_responses)
     
+    def _reply_greeting(self, user_info, match, name):
+        return f"Hello {name}! How can I help you today?" + (f" Thinking of doing some {user_info.get('likes')[0]}?" if user_info.get("likes") else "")
+
+    def _reply_status_check(self, user_info, match, name):
+        return f"I'm just a program, but I'm running perfectly! Thanks for asking, {name}." + (f" Are you planning any {user_info.get('hobby')} projects soon?" if user_info.get("hobby") else "")
+
+    def _reply_sentiment(self, user_info, match, name):
+        word = match.group(1)
+        template = _SENTIMENT_TEMPLATES.get(_SENTIMENT_MAP.get(word))
+        return template.format(name=name) if template else f"I see you're feeling {word}, {name}."
+
+    def _reply_bot_name(self, user_info, match, name):
+        return "You can call me Gemini. And you are " + (name if name != "there" else "...") + "?"
+
+    def _reply_user_name(self, user_info, match, name):
+        return f"Your name is {name}." if name != "there" else "I don't know your name yet. What should I call you?"
+
+    def _reply_farewell(self, user_info, match, name):
+        return f"Goodbye, {name}! Talk to you later."
+    
     def get_relevant_context(self, user_input, user_id):
-        user_input_tokens = re.findall(r'\w+', user_input.lower())
-        if len(user_input_tokens) < 2:
+        input_tf, total_input = _term_frequencies(user_input)
+        if total_input < 2:
             return None
-        input_tf = Counter(user_input_tokens)
-        total_input_terms = sum(input_tf.values())
+        inv_total_input = 1.0 / total_input
         best_match = None
         best_score = 0
         for conv in reversed(self.memory["conversations"][-10:]):
-            if conv["user_id"] == user_id and conv["user_id"] != "bot":
-                conv_tokens = re.findall(r'\w+', conv["input"].lower())
-                conv_tf = Counter(conv_tokens)
-                total_conv_terms = sum(conv_tf.values())
-                score = 0
-                for token in set(user_input_tokens) & set(conv_tokens):
-                    score += min(input_tf[token] / total_input_terms, conv_tf[token] / total_conv_terms)
-                if score > best_score and score > 0.7:
-                    best_match = conv["input"]
-                    best_score = score
+            if conv["user_id"] != user_id or conv["user_id"] == "bot":
+                continue
+            # Term frequencies are computed once per entry and cached on it (never persisted)
+            conv_tf = conv.get("_tf")
+            if conv_tf is None:
+                conv_tf, conv["_tf_total"] = _term_frequencies(conv["input"])
+                conv["_tf"] = conv_tf
+            if not conv["_tf_total"]:
+                continue
+            inv_total_conv = 1.0 / conv["_tf_total"]
+            # Only walk the smaller vocabulary; shared terms are all that score
+            smaller, larger = (input_tf, conv_tf) if len(input_tf) <= len(conv_tf) else (conv_tf, input_tf)
+            score = 0
+            for token in smaller:
+                if token in larger:
+                    score += min(input_tf[token] * inv_total_input, conv_tf[token] * inv_total_conv)
+            if score > best_score and score > 0.7:
+                best_match = conv["input"]
+                best_score = score
+                if best_score > 0.95:
+                    break  # A near-identical match won't be meaningfully beaten
         return best_match
     
     def create_plugin_template(self):
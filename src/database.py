@@ -1,15 +1,42 @@
 # database.py
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 DB_FILE = "chatbot_data.db"
 
-def init_db():
-    """Initializes the database and creates the schedule table if it doesn't exist."""
+# A single long-lived connection shared by all threads; access is serialized by _lock
+_conn = None
+_lock = threading.Lock()
+
+def _get_conn():
+    """Returns the shared database connection, opening it on first use."""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+        _conn.row_factory = sqlite3.Row
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+    return _conn
+
+def close_db():
+    """Closes the shared connection if one is open."""
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+
+def init_db(db_file=None):
+    """Initializes the database and creates the tables if they don't exist."""
+    global DB_FILE
+    if db_file and db_file != DB_FILE:
+        close_db()
+        DB_FILE = db_file
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _lock, _get_conn() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS schedule (
@@ -20,7 +47,20 @@ def init_db():
                     is_announced INTEGER DEFAULT 0
                 )
             """)
-            conn.commit()
+            # The scheduler polls for due events and get_events lists a user's pending ones
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_due ON schedule(is_announced, event_time)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_due ON schedule(user_id, is_announced, event_time)")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    ts TEXT NOT NULL
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_conv_user_ts ON conversations(user_id, ts DESC)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_conv_ts ON conversations(ts)")
             logger.info("Database initialized successfully.")
     except sqlite3.Error as e:
         logger.error(f"Database error during initialization: {e}")
@@ -28,14 +68,12 @@ def init_db():
 def add_event(user_id, event_text, event_time_iso):
     """Adds a new event to the schedule table."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
+        with _lock, _get_conn() as conn:
+            conn.execute(
                 "INSERT INTO schedule (user_id, event_text, event_time) VALUES (?, ?, ?)",
                 (user_id, event_text, event_time_iso)
             )
-            conn.commit()
-            return True
+        return True
     except sqlite3.Error as e:
         logger.error(f"Failed to add event to database: {e}")
         return False
@@ -43,10 +81,8 @@ def add_event(user_id, event_text, event_time_iso):
 def get_events(user_id):
     """Retrieves all non-announced events for a user."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            conn.row_factory = sqlite3.Row # Allows accessing columns by name
-            cursor = conn.cursor()
-            cursor.execute(
+        with _lock:
+            cursor = _get_conn().execute(
                 "SELECT * FROM schedule WHERE user_id = ? AND is_announced = 0 ORDER BY event_time ASC",
                 (user_id,)
             )
@@ -57,12 +93,10 @@ def get_events(user_id):
 
 def get_due_events():
     """Gets all events that are past their scheduled time and haven't been announced."""
-    now_iso = datetime.utcnow().isoformat()
+    now_iso = datetime.now(timezone.utc).isoformat(timespec='seconds')
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute(
+        with _lock:
+            cursor = _get_conn().execute(
                 "SELECT * FROM schedule WHERE event_time <= ? AND is_announced = 0",
                 (now_iso,)
             )
@@ -71,15 +105,78 @@ def get_due_events():
         logger.error(f"Failed to get due events from database: {e}")
         return []
 
+def get_next_due_timestamp():
+    """Returns the POSIX timestamp of the earliest unannounced event, or None if there is none."""
+    try:
+        with _lock:
+            row = _get_conn().execute(
+                "SELECT MIN(event_time) FROM schedule WHERE is_announced = 0"
+            ).fetchone()
+        return datetime.fromisoformat(row[0]).timestamp() if row[0] else None
+    except (sqlite3.Error, ValueError) as e:
+        logger.error(f"Failed to get next due event from database: {e}")
+        return None
+
 def mark_event_as_announced(event_id):
     """Marks a specific event as announced so it doesn't trigger again."""
+    mark_events_as_announced([event_id])
+
+def mark_events_as_announced(event_ids):
+    """Marks several events as announced in a single transaction."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
+        with _lock, _get_conn() as conn:
+            conn.executemany(
                 "UPDATE schedule SET is_announced = 1 WHERE id = ?",
-                (event_id,)
+                [(event_id,) for event_id in event_ids]
             )
-            conn.commit()
     except sqlite3.Error as e:
-        logger.error(f"Failed to mark event as announced: {e}")
\ No newline at end of file
+        logger.error(f"Failed to mark events as announced: {e}")
+
+def add_conversations(entries):
+    """Appends (user_id, role, text, ts) conversation rows in a single transaction."""
+    try:
+        with _lock, _get_conn() as conn:
+            conn.executemany(
+                "INSERT INTO conversations (user_id, role, text, ts) VALUES (?, ?, ?, ?)",
+                entries
+            )
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"Failed to add conversations to database: {e}")
+        return False
+
+def get_recent_conversations(limit):
+    """Retrieves the most recent conversation rows, oldest first."""
+    try:
+        with _lock:
+            cursor = _get_conn().execute(
+                "SELECT * FROM (SELECT * FROM conversations ORDER BY id DESC LIMIT ?) ORDER BY id ASC",
+                (limit,)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        logger.error(f"Failed to get conversations from database: {e}")
+        return []
+
+def prune_conversations(cutoff_iso, keep=None):
+    """Deletes conversation rows older than the given ISO timestamp and, if keep is given,
+    all but the newest `keep` rows."""
+    try:
+        with _lock, _get_conn() as conn:
+            conn.execute("DELETE FROM conversations WHERE ts < ?", (cutoff_iso,))
+            if keep is not None:
+                # The subquery yields no row (so nothing matches) while the table is within bounds
+                conn.execute(
+                    "DELETE FROM conversations WHERE id <= (SELECT id FROM conversations ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (keep,)
+                )
+    except sqlite3.Error as e:
+        logger.error(f"Failed to prune conversations: {e}")
+
+def clear_conversations():
+    """Deletes all conversation rows."""
+    try:
+        with _lock, _get_conn() as conn:
+            conn.execute("DELETE FROM conversations")
+    except sqlite3.Error as e:
+        logger.error(f"Failed to clear conversations: {e}")
\ No newline at end of file
@@ -1,13 +1,61 @@
 # events.py
-from PyQt6.QtCore import QObject, pyqtSignal
+import sys
+import threading
 
-class MessageEmitter(QObject):
+_qt_emitter_class = None
+
+def _get_qt_emitter_class():
+    """Build the QObject-based emitter on first use so PyQt6 is only imported when needed"""
+    global _qt_emitter_class
+    if _qt_emitter_class is None:
+        from PyQt6.QtCore import QObject, pyqtSignal
+
+        class _QtEmitter(QObject):
+            message_emitted = pyqtSignal(str)
+
+        _qt_emitter_class = _QtEmitter
+    return _qt_emitter_class
+
+class DirectBackend:
+    """Plain signal without Qt: handlers run synchronously on the emitting thread."""
+    def __init__(self):
+        self._handlers = []
+        self._lock = threading.Lock()
+
+    def connect(self, handler):
+        with self._lock:
+            self._handlers.append(handler)
+
+    def emit(self, message):
+        with self._lock:
+            handlers = list(self._handlers)
+        for handler in handlers:
+            handler(message)
+
+class QtBackend:
+    """pyqtSignal-backed signal: handlers are delivered through the Qt event loop (GUI thread)."""
+    def __init__(self):
+        self._qt_emitter = _get_qt_emitter_class()()
+        self._signal = self._qt_emitter.message_emitted
+
+    def connect(self, handler):
+        self._signal.connect(handler)
+
+    def emit(self, message):
+        self._signal.emit(message)
+
+class MessageEmitter:
     """
-    A simple object that emits a PyQt signal when a message is ready.
+    A simple object that emits a signal when a message is ready.
     Background threads can call the emit() method, and the UI (or console handler)
     can connect to the message_emitted signal.
-    """
-    message_emitted = pyqtSignal(str)
 
-    def emit(self, message):
-        self.message_emitted.emit(message)
\ No newline at end of file
+    main.py picks the backend: QtBackend under --gui, DirectBackend otherwise.
+    Without one, Qt is used only if PyQt6 is already loaded.
+    """
+    def __init__(self, backend=None):
+        if backend is None:
+            backend = QtBackend() if "PyQt6.QtCore" in sys.modules else DirectBackend()
+        self.message_emitted = backend
+        # Bound once so emit() is a direct call into the backend
+        self.emit = backend.emit
\ No newline at end of file
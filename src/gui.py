@@ -1,13 +1,30 @@
 # gui.py
 import sys
 import queue
-from PyQt6.QtWidgets import (QApplication, QMainWindow, QTextEdit, QLineEdit, 
+from PyQt6.QtWidgets import (QApplication, QMainWindow, QPlainTextEdit, QLineEdit, 
                              QVBoxLayout, QWidget, QSystemTrayIcon, QMenu, QMessageBox)
-from PyQt6.QtGui import QIcon, QAction, QPixmap, QPainter, QColor
-from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtGui import QIcon, QAction, QPixmap, QPainter, QColor, QTextCharFormat, QTextCursor, QFont
+from PyQt6.QtCore import Qt, pyqtSignal
 from events import MessageEmitter
 
+_ICON_SIZE = 64
+_ICON_COLOR = "#4285F4"
+_MAX_CHAT_BLOCKS = 2000  # Older lines are dropped so layout cost stays flat over long sessions
+
+def _char_format(color, bold=False, italic=False):
+    fmt = QTextCharFormat()
+    fmt.setForeground(QColor(color))
+    if bold:
+        fmt.setFontWeight(QFont.Weight.Bold)
+    fmt.setFontItalic(italic)
+    return fmt
+
 class ChatWindow(QMainWindow):
+    _cached_icon = None  # Built on first use and shared by every window
+
+    # Emitted from the webhook thread when it queues a message; delivered on the GUI thread
+    webhook_ready = pyqtSignal()
+
     def __init__(self, bot_instance, emitter, webhook_queue):
         super().__init__()
         self.bot = bot_instance
@@ -21,9 +38,17 @@ class ChatWindow(QMainWindow):
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
         layout = QVBoxLayout(central_widget)
-        self.chat_display = QTextEdit()
+        self.chat_display = QPlainTextEdit()
         self.chat_display.setReadOnly(True)
+        self.chat_display.setUndoRedoEnabled(False)
+        self.chat_display.setMaximumBlockCount(_MAX_CHAT_BLOCKS)
         self.chat_display.setStyleSheet("font-size: 14px;")
+        # (label format, text format) per speaker; plain text with char formats avoids HTML parsing
+        self._formats = {
+            "user": (_char_format("blue", bold=True), _char_format("blue")),
+            "bot": (_char_format("green", bold=True), _char_format("green")),
+            "system": (_char_format("purple", bold=True, italic=True), _char_format("purple", italic=True)),
+        }
         layout.addWidget(self.chat_display)
         self.input_line = QLineEdit()
         self.input_line.setStyleSheet("font-size: 14px;")
@@ -35,22 +60,26 @@ class ChatWindow(QMainWindow):
         self.emitter.message_emitted.connect(self.display_system_message)
         self.emitter.message_emitted.connect(self.show_desktop_notification)
 
-        # --- Setup a timer to check the webhook queue ---
-        self.queue_timer = QTimer(self)
-        self.queue_timer.timeout.connect(self.check_webhook_queue)
-        self.queue_timer.start(250) # Check every 250 milliseconds
+        # --- Drain the webhook queue whenever the producer signals, instead of polling ---
+        self.webhook_ready.connect(self.check_webhook_queue, Qt.ConnectionType.QueuedConnection)
 
         self.create_tray_icon()
+        self.check_webhook_queue()  # Anything queued before the window existed
 
     def check_webhook_queue(self):
-        """Checks the queue for new messages and emits them."""
-        while not self.webhook_queue.empty():
+        """Drains the queue and emits everything waiting as a single message."""
+        if self.webhook_queue is None:
+            return
+        # get_nowait() alone both checks and takes, so each message costs a single deque pop
+        messages = []
+        while True:
             try:
-                message = self.webhook_queue.get_nowait()
-                # Use the existing emitter to display the message
-                self.emitter.emit(message)
+                messages.append(self.webhook_queue.get_nowait())
             except queue.Empty:
                 break
+        if messages:
+            # A burst of webhooks becomes one chat update and one tray notification
+            self.emitter.emit("\n".join(messages))
     
     # ... (all other methods like show_desktop_notification, generate_icon, etc. are the same)
     def show_desktop_notification(self, message):
@@ -62,14 +91,17 @@ class ChatWindow(QMainWindow):
         self.tray_icon.showMessage(title, message, QSystemTrayIcon.MessageIcon.Information, 5000)
         
     def generate_icon(self):
-        pixmap = QPixmap(64, 64)
+        if ChatWindow._cached_icon is not None:
+            return ChatWindow._cached_icon
+        pixmap = QPixmap(_ICON_SIZE, _ICON_SIZE)
         pixmap.fill(Qt.GlobalColor.transparent)
         painter = QPainter(pixmap)
-        painter.setBrush(QColor("#4285F4"))
+        painter.setBrush(QColor(_ICON_COLOR))
         painter.setPen(Qt.PenStyle.NoPen)
-        painter.drawEllipse(0, 0, 64, 64)
+        painter.drawEllipse(0, 0, _ICON_SIZE, _ICON_SIZE)
         painter.end()
-        return QIcon(pixmap)
+        ChatWindow._cached_icon = QIcon(pixmap)
+        return ChatWindow._cached_icon
 
     def create_tray_icon(self):
         self.tray_icon = QSystemTrayIcon(self.generate_icon(), self)
@@ -112,13 +144,25 @@ class ChatWindow(QMainWindow):
         self.hide()
         self.tray_icon.showMessage("Still Running", "The chatbot is running in the system tray.", QSystemTrayIcon.MessageIcon.Information, 2000)
 
+    def append_message(self, speaker, label, text):
+        """Append one formatted line to the chat display"""
+        label_format, text_format = self._formats[speaker]
+        cursor = self.chat_display.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        if not self.chat_display.document().isEmpty():
+            cursor.insertBlock()
+        cursor.insertText(f"{label} ", label_format)
+        cursor.insertText(text, text_format)
+        scrollbar = self.chat_display.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
+
     def send_message(self):
         user_input = self.input_line.text()
         if not user_input: return
-        self.chat_display.append(f"<font color='blue'><b>You:</b> {user_input}</font>")
+        self.append_message("user", "You:", user_input)
         self.input_line.clear()
         bot_response = self.bot.process_message(user_input)
-        self.chat_display.append(f"<font color='green'><b>Bot:</b> {bot_response}</font>")
+        self.append_message("bot", "Bot:", bot_response)
 
     def display_system_message(self, message):
-        self.chat_display.append(f"<font color='purple'><i><b>System:</b> {message}</i></font>")
\ No newline at end of file
+        self.append_message("system", "System:", message)
\ No newline at end of file
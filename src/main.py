@@ -1,4 +1,5 @@
 # main.py
+import atexit
 import time
 from datetime import datetime
 import pytz
@@ -8,16 +9,30 @@ import database
 import sys
 
 from core import AIChatBot
-from PyQt6.QtWidgets import QApplication
+from events import MessageEmitter, DirectBackend
 
 # The logger for this file
 logger = logging.getLogger(__name__)
 
+_stdout_write = sys.stdout.write
+
+def console_handler(message):
+    """Prints an emitted message above a fresh prompt in console mode."""
+    _stdout_write(f"\n{message}\n> ")
+    sys.stdout.flush()
+
+# Upper bound on a scheduler nap when nothing is scheduled, and lower bound between checks
+IDLE_WAIT_SECONDS = 3600
+MIN_WAIT_SECONDS = 1
+
 def scheduler_loop(bot):
-    """A loop that runs in the background to check for scheduled events from the database."""
+    """A loop that runs in the background to check for scheduled events from the database.
+
+    It sleeps until the next event is due, and is woken early through bot.scheduler_cond
+    whenever a plugin schedules something new.
+    """
     logger.info("Scheduler thread started.")
     while True:
-        time.sleep(60)
         try:
             due_events = database.get_due_events()
             if due_events:
@@ -26,33 +41,56 @@ def scheduler_loop(bot):
                     message = f"⏰ REMINDER: {event['event_text']}"
                     bot.emitter.emit(message)
                     logger.info(f"Reminder triggered: {event['event_text']}")
-                    database.mark_event_as_announced(event['id'])
+                # Mark the whole batch in one transaction
+                database.mark_events_as_announced([event['id'] for event in due_events])
         except Exception as e:
             logger.error(f"Error in scheduler loop: {e}")
 
+        # Holding the condition from the lookup until wait() releases it means a
+        # notify for a newly added event can't slip in between and be missed
+        with bot.scheduler_cond:
+            next_due = database.get_next_due_timestamp()
+            wait = max(MIN_WAIT_SECONDS, next_due - time.time()) if next_due is not None else IDLE_WAIT_SECONDS
+            bot.scheduler_cond.wait(timeout=wait)
+
 # Main execution block
 if __name__ == "__main__":
-    database.init_db()
-    bot = AIChatBot()
+    gui_mode = "--gui" in sys.argv
+    if gui_mode:
+        # Only the GUI needs Qt's cross-thread signal delivery; console and
+        # service modes call handlers directly and never load PyQt6.
+        from PyQt6.QtWidgets import QApplication
+        from events import QtBackend
+        emitter = MessageEmitter(QtBackend())
+    else:
+        emitter = MessageEmitter(DirectBackend())
+    bot = AIChatBot(emitter=emitter)
+    # Also covers exits that skip the shutdown calls below (unhandled errors, sys.exit)
+    atexit.register(bot.shutdown)
 
     # Start the background scheduler thread
     scheduler_thread = threading.Thread(target=scheduler_loop, args=(bot,), daemon=True)
     scheduler_thread.start()
 
-    if "--gui" in sys.argv:
+    if gui_mode:
         # --- GUI Mode ---
         logger.info("AI Chatbot started in GUI mode.")
         from gui import ChatWindow
         app = QApplication(sys.argv)
         
-        # Get the queue from the webhook plugin instance
-        webhook_plugin_instance = bot.plugin_manager.plugins.get("webhook_plugin", {}).get("instance")
-        webhook_queue = webhook_plugin_instance.webhook_queue if webhook_plugin_instance else None
+        # Get the queue from the webhook service; it outlives plugin reloads
+        webhook_service = bot.services.get("webhook")
+        webhook_queue = webhook_service["queue"] if webhook_service else None
         
         # Pass the queue to the ChatWindow
         window = ChatWindow(bot, bot.emitter, webhook_queue)
+        if webhook_service:
+            # Wake the GUI when a webhook arrives rather than having it poll the queue
+            webhook_service["on_message"] = window.webhook_ready.emit
         window.show()
-        sys.exit(app.exec())
+        exit_code = app.exec()
+        bot.shutdown()
+        sys.exit(exit_code)
 
     elif "--no-interactive" in sys.argv:
         # --- Service Mode ---
@@ -62,14 +100,13 @@ if __name__ == "__main__":
                 time.sleep(3600)
         except KeyboardInterrupt:
             logger.info("AI Chatbot service shutting down.")
+        bot.shutdown()
             
     else:
         # --- Console Mode ---
         logger.info("AI Chatbot started in interactive mode. Type '!help' or 'quit' to exit.")
         
         # Connect the emitter to a handler that prints to the console
-        def console_handler(message):
-            print(f"\n{message}\n> ", end="", flush=True)
         bot.emitter.message_emitted.connect(console_handler)
 
         while True:
@@ -82,5 +119,6 @@ if __name__ == "__main__":
             except KeyboardInterrupt:
                 break
             except Exception as e:
-                logger.error(f"Error processing input: {e}\n{traceback.format_exc()}")
-                print("Bot: An error occurred. Please try again.")
\ No newline at end of file
+                logger.exception(f"Error processing input: {e}")
+                print("Bot: An error occurred. Please try again.")
+        bot.shutdown()
\ No newline at end of file
@@ -1,34 +1,55 @@
 import re
+import time
+from operator import itemgetter
 import requests
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from utils import HTTP_TIMEOUT
+
+# How long a fetched briefing section stays fresh, in seconds
+_WEATHER_TTL = 600  # Conditions change on roughly a ten-minute scale
+_JOKE_TTL = 86400  # It's the joke of the *day*
 
 class Plugin:
     metadata = {
         "name": "Proactive Assistant Plugin",
         "version": "1.0",
-        "description": "Provides a daily briefing by summarizing information from other plugins."
+        "description": "Provides a daily briefing by summarizing information from other plugins.",
+        "commands": ["briefing", "summary"]
     }
 
     def __init__(self, bot):
         self.bot = bot
+        # The bot's shared session, so briefings reuse pooled connections to the weather and joke APIs
+        self.http = bot.http
         # You can reuse your API keys from the other plugins here
         self.weather_api_key = "YOUR_WEATHER_API_KEY" # Paste your OpenWeatherMap API key
+        # (time.monotonic() when fetched, briefing line); only successful fetches are cached
+        self._weather_cache = (0.0, None)
+        self._joke_cache = (0.0, None)
+        self._date_cache = (None, None)  # (date, formatted heading date)
 
     def _get_weather_briefing(self):
         """Fetches and formats the weather part of the briefing."""
         if not self.weather_api_key or self.weather_api_key == "YOUR_WEATHER_API_KEY":
             return "🌤️ Weather: (API key not configured)"
 
+        fetched_at, cached = self._weather_cache
+        now = time.monotonic()
+        if cached is not None and now - fetched_at < _WEATHER_TTL:
+            return cached
+
         location = "Marsden, AU"
         url = f"http://api.openweathermap.org/data/2.5/weather?q={location}&appid={self.weather_api_key}&units=metric"
         
         try:
-            response = requests.get(url, timeout=5)
+            response = self.http.get(url, timeout=HTTP_TIMEOUT)
             response.raise_for_status()
             data = response.json()
             temp = data['main']['temp']
             desc = data['weather'][0]['description'].title()
-            return f"🌤️ Weather: The forecast for {location.split(',')[0]} is {temp}°C with {desc}."
+            result = f"🌤️ Weather: The forecast for {location.split(',')[0]} is {temp}°C with {desc}."
+            self._weather_cache = (now, result)
+            return result
         except requests.exceptions.RequestException:
             return "🌤️ Weather: (Could not fetch data)"
 
@@ -38,23 +59,31 @@ class Plugin:
         if not todo_list:
             return "✅ To-Do List: Your to-do list is empty. Great job!"
 
+        # Today's local bounds as epoch seconds, so each due time is two integer compares
         today = date.today()
+        today_start = datetime.combine(today, datetime.min.time()).timestamp()
+        tomorrow_start = datetime.combine(today + timedelta(days=1), datetime.min.time()).timestamp()
+        pending_count = 0
         overdue_count = 0
         due_today_count = 0
 
+        # One pass counts pending, overdue and due-today tasks together
         for task in todo_list:
             if task.get("completed"):
                 continue
+            pending_count += 1
             
-            if "due_date" in task:
-                due_date = datetime.fromisoformat(task["due_date"]).date()
-                if due_date < today:
+            due_ts = task.get("due_ts")
+            if due_ts is None and "due_date" in task:
+                # Saved before due times were stored as epoch seconds
+                due_ts = datetime.fromisoformat(task["due_date"]).timestamp()
+            if due_ts is not None:
+                if due_ts < today_start:
                     overdue_count += 1
-                elif due_date == today:
+                elif due_ts < tomorrow_start:
                     due_today_count += 1
         
         if overdue_count == 0 and due_today_count == 0:
-            pending_count = len([t for t in todo_list if not t.get("completed")])
             return f"✅ To-Do List: You have no tasks due today. {pending_count} pending tasks overall."
         
         parts = []
@@ -72,7 +101,7 @@ class Plugin:
             return None # Don't show the notes section if there are no notes
 
         # Find the most recent note
-        most_recent_note = sorted(notes, key=lambda n: n["created"], reverse=True)[0]
+        most_recent_note = max(notes, key=itemgetter("created"))
         title = most_recent_note.get('title', 'Untitled')
         text = most_recent_note.get('text', '')
         
@@ -80,35 +109,51 @@ class Plugin:
 
     def _get_joke_briefing(self):
         """Fetches a random joke for the briefing."""
+        fetched_at, cached = self._joke_cache
+        now = time.monotonic()
+        if cached is not None and now - fetched_at < _JOKE_TTL:
+            return cached
+
         try:
             headers = {"Accept": "application/json"}
-            response = requests.get("https://icanhazdadjoke.com/", headers=headers, timeout=5)
+            response = self.http.get("https://icanhazdadjoke.com/", headers=headers, timeout=HTTP_TIMEOUT)
             response.raise_for_status()
-            return f"😂 Joke of the Day: {response.json()['joke']}"
+            result = f"😂 Joke of the Day: {response.json()['joke']}"
+            self._joke_cache = (now, result)
+            return result
         except requests.exceptions.RequestException:
             return "😂 Joke of the Day: (Could not fetch a joke)"
 
     def process(self, user_input, default_response):
-        if user_input.lower() not in ["!briefing", "!summary"]:
+        if self.bot.lowered(user_input) not in ["!briefing", "!summary"]:
             return None
 
         user_id = self.bot.config["default_user_id"]
         user_data = self.bot.memory["knowledge"]["users"].get(user_id, {})
         
+        # Start the network-bound sections first, side by side on the bot's shared
+        # executor, and build the local ones meanwhile
+        weather_future = self.bot.executor.submit(self._get_weather_briefing)
+        joke_future = self.bot.executor.submit(self._get_joke_briefing)
+
         # --- Assemble the Briefing ---
-        today_formatted = datetime.now().strftime('%A, %B %d, %Y')
+        today = date.today()
+        cached_day, today_formatted = self._date_cache
+        if cached_day != today:
+            today_formatted = today.strftime('%A, %B %d, %Y')
+            self._date_cache = (today, today_formatted)
         briefing_parts = [
             f"**Good morning! Here's your daily briefing for {today_formatted}:**"
         ]
         
         # Add each section to the briefing
-        briefing_parts.append(self._get_weather_briefing())
         briefing_parts.append(self._get_todo_briefing(user_data))
         
         notes_part = self._get_notes_briefing(user_data)
         if notes_part: # Only add notes if there are any
             briefing_parts.append(notes_part)
             
-        briefing_parts.append(self._get_joke_briefing())
+        briefing_parts.insert(1, weather_future.result())
+        briefing_parts.append(joke_future.result())
 
         return "\n\n".join(briefing_parts)
\ No newline at end of file
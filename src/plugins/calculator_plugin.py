@@ -1,6 +1,18 @@
 import re
 import math
-from decimal import Decimal, InvalidOperation
+
+# A single scan classifies every token; characters matching no group (e.g. spaces) are skipped
+_TOKEN_RE = re.compile(r'(?P<num>\d*\.?\d+)|(?P<name>\w+)|(?P<op>[+\-*/^])|(?P<lparen>\()|(?P<rparen>\))')
+# "calculate [expression]" or "[expression] = ?"
+_CALC_RE = re.compile(r"^(?:calculate\s+(.+)|(.+)\s*=\s*\?$)")
+
+_HELP = (
+    "Calculator Plugin Commands:\n"
+    "calculate [expression] or [expression] = ? : Evaluate a mathematical expression\n"
+    "Supported operations: +, -, *, /, ^ (power)\n"
+    "Supported functions: sin, cos, tan, sqrt, abs\n"
+    "Example: calculate 2 + 3 * sin(30) or 2 + 3 * sin(30) = ?"
+)
 
 class Plugin:
     metadata = {
@@ -29,17 +41,23 @@ class Plugin:
         }
 
     def tokenize(self, expression):
-        """Convert expression into tokens"""
-        # Replace multiple spaces with single space and trim
-        expression = re.sub(r'\s+', ' ', expression.strip())
-        
-        # Tokenize numbers, operators, functions, and parentheses
-        token_pattern = r'(\d*\.?\d+|\w+|[+\-*/^()]|\s)'
-        tokens = [t for t in re.findall(token_pattern, expression) if t.strip()]
+        """Convert expression into (kind, value) tokens; numbers become floats while scanning"""
+        tokens = []
+        for match in _TOKEN_RE.finditer(expression):
+            kind = match.lastgroup
+            value = match.group()
+            tokens.append((kind, float(value) if kind == "num" else value))
         return tokens
 
     def apply_operator(self, operators, values):
         """Apply an operator to values from the stack"""
+        if operators and operators[-1] == "neg":
+            # Unary minus takes a single operand
+            operators.pop()
+            if not values:
+                return False
+            values.append(-values.pop())
+            return True
         if not operators or len(values) < 2:
             return False
         op = operators.pop()
@@ -65,73 +83,52 @@ class Plugin:
 
     def get_precedence(self, op):
         """Get operator precedence"""
-        precedences = {'+': 1, '-': 1, '*': 2, '/': 2, '^': 3}
+        # Unary minus binds tighter than * but looser than ^, so -2^2 is -4
+        precedences = {'+': 1, '-': 1, '*': 2, '/': 2, 'neg': 3, '^': 4}
         return precedences.get(op, 0)
 
     def evaluate(self, tokens):
         """Evaluate a list of tokens using Shunting Yard algorithm"""
         values = []
+        # Holds operators, '(' sentinels, and ("func", name) markers that sit just below
+        # their '(' until the matching ')' applies them; nesting needs no recursion
         operators = []
-        i = 0
         
-        while i < len(tokens):
-            token = tokens[i]
-            
-            if token in self.functions:
+        for i, (kind, token) in enumerate(tokens):
+            if kind == "num":
+                values.append(token)
+            elif kind == "name":
                 # Handle function calls (e.g., sin, cos)
-                if i + 1 < len(tokens) and tokens[i + 1] == '(':
-                    # Find matching closing parenthesis
-                    paren_count = 1
-                    j = i + 2
-                    while j < len(tokens) and paren_count > 0:
-                        if tokens[j] == '(':
-                            paren_count += 1
-                        elif tokens[j] == ')':
-                            paren_count -= 1
-                        j += 1
-                    if paren_count == 0:
-                        # Evaluate expression inside parentheses
-                        sub_result = self.evaluate(tokens[i + 2:j - 1])
-                        if sub_result is None:
-                            return None
-                        values.append(sub_result)
-                        if not self.apply_function(token, values):
-                            return None
-                        i = j
-                    else:
-                        return None
-                else:
-                    return None
-            elif re.match(r'^-?\d*\.?\d+$', token):
-                # Handle numbers
-                try:
-                    values.append(Decimal(token))
-                except InvalidOperation:
+                if token not in self.functions or i + 1 >= len(tokens) or tokens[i + 1][0] != "lparen":
                     return None
-            elif token in self.operators:
+                operators.append(("func", token))
+            elif kind == "op" and token == "-" and (i == 0 or tokens[i - 1][0] in ("op", "lparen")):
+                # A minus with no left operand negates what follows; as a prefix operator
+                # it has nothing on the stack to apply first
+                operators.append("neg")
+            elif kind == "op":
                 # Handle operators with precedence
                 while (operators and operators[-1] != '(' and 
                        self.get_precedence(operators[-1]) >= self.get_precedence(token)):
                     if not self.apply_operator(operators, values):
                         return None
                 operators.append(token)
-            elif token == '(':
+            elif kind == "lparen":
                 operators.append(token)
-            elif token == ')':
+            else:  # rparen
                 while operators and operators[-1] != '(':
                     if not self.apply_operator(operators, values):
                         return None
-                if operators and operators[-1] == '(':
-                    operators.pop()
-                else:
+                if not operators:
                     return None
-            else:
-                return None
-            i += 1
+                operators.pop()
+                if operators and isinstance(operators[-1], tuple):
+                    if not self.apply_function(operators.pop()[1], values):
+                        return None
 
         # Process remaining operators
         while operators:
-            if operators[-1] == '(':
+            if operators[-1] == '(' or isinstance(operators[-1], tuple):
                 return None
             if not self.apply_operator(operators, values):
                 return None
@@ -141,7 +138,7 @@ class Plugin:
     def process(self, user_input, default_response):
         """Process user input for calculation requests"""
         # Look for "calculate [expression]" or "[expression] = ?"
-        match = re.search(r"^(?:calculate\s+(.+)|(.+)\s*=\s*\?$)", user_input.lower().strip())
+        match = _CALC_RE.match(self.bot.lowered(user_input).strip())
         if not match:
             return None
 
@@ -167,13 +164,7 @@ class Plugin:
         """Called when plugin is loaded"""
         self.bot.command_registry.register(
             "calc_help",
-            lambda bot, args: (
-                "Calculator Plugin Commands:\n"
-                "calculate [expression] or [expression] = ? : Evaluate a mathematical expression\n"
-                "Supported operations: +, -, *, /, ^ (power)\n"
-                "Supported functions: sin, cos, tan, sqrt, abs\n"
-                "Example: calculate 2 + 3 * sin(30) or 2 + 3 * sin(30) = ?"
-            ),
+            lambda bot, args: _HELP,
             "Show calculator plugin help"
         )
 
@@ -1,13 +1,123 @@
 from datetime import datetime, timedelta
+import os
 import re
+from functools import lru_cache
 import pytz
 import database
 
+@lru_cache(maxsize=512)
+def _tz(name):
+    """pytz.timezone() with the lookup cached per name; unknown names still raise"""
+    return pytz.timezone(name)
+
+# Every command in one pattern: each alternative is wrapped in a named group that closes
+# last, so match.lastgroup names the command and keys _COMMAND_HANDLERS
+_COMMAND_RE = re.compile(
+    r"^!(?:"
+    r"(?P<time>time(?:\s+in\s+(?P<time_tz>[\w\s\/]+))?)"
+    r"|(?P<date>date(?:\s+in\s+(?P<date_tz>[\w\s\/]+))?)"
+    r"|(?P<settimezone>settimezone\s+(?P<new_tz>[\w\s\/]+))"
+    r"|(?P<timeuntil>timeuntil\s+(?P<offset>.+))"
+    r"|(?P<schedule_list>schedule list)"
+    r")$",
+    re.IGNORECASE
+)
+_COMMAND_HANDLERS = {
+    "time": "_cmd_time",
+    "date": "_cmd_date",
+    "settimezone": "_cmd_settimezone",
+    "timeuntil": "_cmd_timeuntil",
+    "schedule_list": "_cmd_schedule_list",
+}
+# strftime formats without leading zeros on the hour and day; the flag is platform specific
+_NO_PAD = "#" if os.name == "nt" else "-"
+_TIME_FORMAT = f"%{_NO_PAD}I:%M %p"
+_DATE_FORMAT = f"%A, %B %{_NO_PAD}d, %Y"
+_EVENT_FORMAT = f"{_TIME_FORMAT} on {_DATE_FORMAT}"
+_DATETIME_FORMAT = f"{_TIME_FORMAT}, {_DATE_FORMAT}"
+# Fields of "!schedule <event> at <time> [on <date>] [in <timezone>]", which is split on its
+# keywords by _parse_schedule rather than matched with a lazy pattern. Any run of whitespace
+# around the keywords counts; "at" only checks for the space after it, as that space may
+# also lead into the next " at " when the event text ends in "at"
+_SCHEDULE_PREFIX_RE = re.compile(r"!schedule\s+", re.IGNORECASE)
+_SCHEDULE_AT_RE = re.compile(r"\s+at(?=\s)", re.IGNORECASE)
+_SCHEDULE_ON_RE = re.compile(r"\s+on\s+", re.IGNORECASE)
+_SCHEDULE_IN_RE = re.compile(r"\s+in\s+", re.IGNORECASE)
+_TIME_ONLY_RE = re.compile(r"\d{1,2}:\d{2}\s*(?:am|pm)?", re.IGNORECASE)
+_DATE_ONLY_RE = re.compile(r"\d{1,2}/\d{1,2}/\d{4}")
+_TZ_ONLY_RE = re.compile(r"[\w\s\/]+")
+_WHAT_TIME_RE = re.compile(r"\bwhat time is it\b", re.IGNORECASE)
+_WHAT_DATE_RE = re.compile(r"\bwhat is the date\b", re.IGNORECASE)
+
+# Date offsets understood by parse_date_offset, in one pattern. Each alternative is a named
+# group, so match.lastgroup picks the entry of _OFFSET_HANDLERS: handler(now, group text)
+_OFFSET_RE = re.compile(
+    r"(?:in\s+(?P<days>\d+)\s+days?"
+    r"|in\s+(?P<weeks>\d+)\s+weeks?"
+    r"|in\s+(?P<hours>\d+)\s+hours?"
+    r"|(?P<nextweek>next\s+week)"
+    r"|(?P<tomorrow>tomorrow)"
+    r"|(?P<mdy>\d{1,2}/\d{1,2}/\d{4}))",
+    re.IGNORECASE
+)
+_OFFSET_HANDLERS = {
+    "days": lambda now, n: now + timedelta(days=int(n)),
+    "weeks": lambda now, n: now + timedelta(weeks=int(n)),
+    "hours": lambda now, n: now + timedelta(hours=int(n)),
+    "nextweek": lambda now, _: now + timedelta(weeks=1),
+    "tomorrow": lambda now, _: now + timedelta(days=1),
+    "mdy": lambda now, d: datetime.strptime(d, "%m/%d/%Y").replace(tzinfo=pytz.UTC),
+}
+
+_HELP = (
+    "Date & Time Plugin Commands:\n"
+    "!time [in <timezone>] : Get current time\n"
+    "!date [in <timezone>] : Get current date\n"
+    "!settimezone <timezone> : Set your preferred timezone\n"
+    "!timeuntil <date or offset> : Calculate time until a date\n"
+    "!schedule <event> at <time> [on <MM/DD/YYYY>] [in <timezone>] : Schedule an event\n"
+    "!schedule list : List scheduled events\n"
+    "Examples:\n"
+    "  !time in America/New_York\n"
+    "  !timeuntil in 2 days\n"
+    "  !schedule Meeting at 2:30 pm on 12/31/2025 in Europe/London\n"
+    "  !settimezone Asia/Tokyo"
+)
+
+def _parse_schedule(rest):
+    """Split "<event> at <time> [on <date>] [in <timezone>]" into (event, time, date, timezone),
+    with None for omitted parts, or return None if it isn't a valid schedule request"""
+    # The last " at " starts the time, so event text may itself contain " at "
+    at = None
+    for at in _SCHEDULE_AT_RE.finditer(rest):
+        pass
+    if at is None:
+        return None
+    event = rest[:at.start()].strip()
+    tail = rest[at.end():]
+    date_str = timezone = None
+    cut = _SCHEDULE_IN_RE.search(tail)
+    if cut:
+        tail, timezone = tail[:cut.start()], tail[cut.end():].strip()
+        if not _TZ_ONLY_RE.fullmatch(timezone):
+            return None
+    cut = _SCHEDULE_ON_RE.search(tail)
+    if cut:
+        tail, date_str = tail[:cut.start()], tail[cut.end():].strip()
+        if not _DATE_ONLY_RE.fullmatch(date_str):
+            return None
+    time_str = tail.strip()
+    if not event or not _TIME_ONLY_RE.fullmatch(time_str):
+        return None
+    return event, time_str, date_str, timezone
+
 class Plugin:
     metadata = {
         "name": "Date & Time Plugin",
         "version": "2.0",
-        "description": "Provides advanced date and time functions including time zones, date arithmetic, and scheduling."
+        "description": "Provides advanced date and time functions including time zones, date arithmetic, and scheduling.",
+        "commands": ["time", "date", "settimezone", "timeuntil", "schedule"],
+        "catch_all": True  # Also answers "what time is it" / "what is the date"
     }
 
     def __init__(self, bot):
@@ -24,172 +134,157 @@ class Plugin:
         """Set user's preferred timezone in memory"""
         user_data = self.bot.memory["knowledge"]["users"].setdefault(user_id, {})
         try:
-            pytz.timezone(timezone)  # Validate timezone
+            _tz(timezone)  # Validate timezone
             user_data["timezone"] = timezone
-            self.bot.save_memory()
+            self.bot.mark_dirty()
             return True
         except pytz.exceptions.UnknownTimeZoneError:
             return False
 
-    def format_datetime(self, dt, timezone, format_str="%I:%M %p, %A, %B %d, %Y"):
+    def format_datetime(self, dt, timezone, format_str=_DATETIME_FORMAT):
         """Format datetime for given timezone"""
-        tz = pytz.timezone(timezone)
+        tz = _tz(timezone)
         dt = dt.astimezone(tz)
-        return dt.strftime(format_str).lstrip("0").replace(" 0", " ")
+        return dt.strftime(format_str)
 
-    def parse_date_offset(self, offset_str):
-        """Parse date offset (e.g., 'in 2 days', 'next week')"""
+    def parse_date_offset(self, offset_str, now=None):
+        """Parse date offset (e.g., 'in 2 days', 'next week') relative to now, which
+        defaults to the current UTC time"""
         offset_str = offset_str.lower().strip()
-        now = datetime.now(pytz.UTC)
-        
-        patterns = [
-            (r"in\s+(\d+)\s+days?", lambda n: now + timedelta(days=int(n))),
-            (r"in\s+(\d+)\s+weeks?", lambda n: now + timedelta(weeks=int(n))),
-            (r"in\s+(\d+)\s+hours?", lambda n: now + timedelta(hours=int(n))),
-            (r"next\s+week", lambda _: now + timedelta(weeks=1)),
-            (r"tomorrow", lambda _: now + timedelta(days=1)),
-            (r"(\d{1,2}/\d{1,2}/\d{4})", lambda d: datetime.strptime(d, "%m/%d/%Y").replace(tzinfo=pytz.UTC))
-        ]
+        now = now or datetime.now(pytz.UTC)
         
-        for pattern, handler in patterns:
-            match = re.match(pattern, offset_str, re.IGNORECASE)
-            if match:
-                try:
-                    return handler(match.group(1) if match.group(1) else None)
-                except ValueError:
-                    return None
-        return None
+        match = _OFFSET_RE.match(offset_str)
+        if not match:
+            return None
+        try:
+            return _OFFSET_HANDLERS[match.lastgroup](now, match.group(match.lastgroup))
+        except ValueError:
+            return None
 
     def process(self, user_input, default_response):
         """Process user input for date and time commands"""
         user_id = self.bot.config["default_user_id"]
         user_timezone = self.get_user_timezone(user_id)
 
-        # Command: !time [timezone]
-        time_match = re.match(r"^!time(?:\s+in\s+([\w\s\/]+))?$", user_input, re.IGNORECASE)
-        if time_match:
-            timezone = time_match.group(1).strip() if time_match.group(1) else user_timezone
-            try:
-                tz = pytz.timezone(timezone)
-                current_time = datetime.now(tz)
-                return f"The current time in {timezone} is {self.format_datetime(current_time, timezone, '%I:%M %p')}."
-            except pytz.exceptions.UnknownTimeZoneError:
-                return f"Invalid timezone: {timezone}. Try 'America/New_York' or 'Europe/London'."
-
-        # Command: !date [timezone]
-        date_match = re.match(r"^!date(?:\s+in\s+([\w\s\/]+))?$", user_input, re.IGNORECASE)
-        if date_match:
-            timezone = date_match.group(1).strip() if date_match.group(1) else user_timezone
-            try:
-                tz = pytz.timezone(timezone)
-                current_date = datetime.now(tz)
-                return f"Today's date in {timezone} is {self.format_datetime(current_date, timezone, '%A, %B %d, %Y')}."
-            except pytz.exceptions.UnknownTimeZoneError:
-                return f"Invalid timezone: {timezone}. Try 'America/New_York' or 'Europe/London'."
-
-        # Command: !settimezone <timezone>
-        tz_match = re.match(r"^!settimezone\s+([\w\s\/]+)$", user_input, re.IGNORECASE)
-        if tz_match:
-            timezone = tz_match.group(1).strip()
-            if self.set_user_timezone(user_id, timezone):
-                return f"Timezone set to {timezone}."
+        # Only "!" input can be a command; plain chat goes straight to the legacy phrases
+        if user_input.startswith("!"):
+            command_match = _COMMAND_RE.match(user_input)
+            if command_match:
+                return getattr(self, _COMMAND_HANDLERS[command_match.lastgroup])(command_match, user_id, user_timezone)
+            schedule_match = _SCHEDULE_PREFIX_RE.match(user_input)
+            if schedule_match:
+                fields = _parse_schedule(user_input[schedule_match.end():])
+                if fields:
+                    return self._cmd_schedule(fields, user_id, user_timezone)
+
+        # Legacy support for original queries
+        if _WHAT_TIME_RE.search(user_input):
+            current_time = datetime.now(_tz(user_timezone))
+            return f"The current time in your timezone ({user_timezone}) is {self.format_datetime(current_time, user_timezone, _TIME_FORMAT)}."
+        
+        if _WHAT_DATE_RE.search(user_input):
+            current_date = datetime.now(_tz(user_timezone))
+            return f"Today's date in your timezone ({user_timezone}) is {self.format_datetime(current_date, user_timezone, _DATE_FORMAT)}."
+
+        return None
+
+    # Command: !time [timezone]
+    def _cmd_time(self, match, user_id, user_timezone):
+        timezone = match.group("time_tz").strip() if match.group("time_tz") else user_timezone
+        try:
+            tz = _tz(timezone)
+            current_time = datetime.now(tz)
+            return f"The current time in {timezone} is {self.format_datetime(current_time, timezone, _TIME_FORMAT)}."
+        except pytz.exceptions.UnknownTimeZoneError:
             return f"Invalid timezone: {timezone}. Try 'America/New_York' or 'Europe/London'."
 
-        # Command: !timeuntil <date or offset>
-        until_match = re.match(r"^!timeuntil\s+(.+)$", user_input, re.IGNORECASE)
-        if until_match:
-            offset_str = until_match.group(1).strip()
-            target_date = self.parse_date_offset(offset_str)
-            if not target_date:
-                return f"Invalid date format: {offset_str}. Try 'in 2 days', 'next week', or 'MM/DD/YYYY'."
-            
-            now = datetime.now(pytz.UTC)
-            delta = target_date - now
-            if delta.total_seconds() < 0:
-                return f"The date {offset_str} is in the past."
-                
-            days = delta.days
-            hours, remainder = divmod(delta.seconds, 3600)
-            minutes = remainder // 60
-            response = f"Time until {offset_str}: "
-            parts = []
-            if days > 0:
-                parts.append(f"{days} day{'s' if days != 1 else ''}")
-            if hours > 0:
-                parts.append(f"{hours} hour{'s' if hours != 1 else ''}")
-            if minutes > 0:
-                parts.append(f"{minutes} minute{'s' if minutes != 1 else ''}")
-            return response + (", ".join(parts) or "less than a minute")
-
-        # Command: !schedule <event> at <time> [on <date>] [in <timezone>]
-        schedule_match = re.match(
-            r"^!schedule\s+(.+?)\s+at\s+(\d{1,2}:\d{2}\s*(?:am|pm)?)(?:\s+on\s+(\d{1,2}/\d{1,2}/\d{4}))?(?:\s+in\s+([\w\s\/]+))?$",
-            user_input, re.IGNORECASE
-        )
-        if schedule_match:
-            event = schedule_match.group(1).strip()
-            time_str = schedule_match.group(2).strip()
-            date_str = schedule_match.group(3).strip() if schedule_match.group(3) else datetime.now().strftime("%m/%d/%Y")
-            timezone = schedule_match.group(4).strip() if schedule_match.group(4) else user_timezone
+    # Command: !date [timezone]
+    def _cmd_date(self, match, user_id, user_timezone):
+        timezone = match.group("date_tz").strip() if match.group("date_tz") else user_timezone
+        try:
+            tz = _tz(timezone)
+            current_date = datetime.now(tz)
+            return f"Today's date in {timezone} is {self.format_datetime(current_date, timezone, _DATE_FORMAT)}."
+        except pytz.exceptions.UnknownTimeZoneError:
+            return f"Invalid timezone: {timezone}. Try 'America/New_York' or 'Europe/London'."
+
+    # Command: !settimezone <timezone>
+    def _cmd_settimezone(self, match, user_id, user_timezone):
+        timezone = match.group("new_tz").strip()
+        if self.set_user_timezone(user_id, timezone):
+            return f"Timezone set to {timezone}."
+        return f"Invalid timezone: {timezone}. Try 'America/New_York' or 'Europe/London'."
+
+    # Command: !timeuntil <date or offset>
+    def _cmd_timeuntil(self, match, user_id, user_timezone):
+        offset_str = match.group("offset").strip()
+        target_date = self.parse_date_offset(offset_str)
+        if not target_date:
+            return f"Invalid date format: {offset_str}. Try 'in 2 days', 'next week', or 'MM/DD/YYYY'."
+        
+        now = datetime.now(pytz.UTC)
+        delta = target_date - now
+        if delta.total_seconds() < 0:
+            return f"The date {offset_str} is in the past."
             
-            try:
-                tz = pytz.timezone(timezone)
-                naive_dt = datetime.strptime(f"{date_str} {time_str}", "%m/%d/%Y %I:%M %p")
-                event_time_local = tz.localize(naive_dt)
-                event_time_utc = event_time_local.astimezone(pytz.UTC)
-
-                if database.add_event(user_id, event, event_time_utc.isoformat()):
-                    return f"📅 Scheduled: {event} at {self.format_datetime(event_time_local, timezone, '%I:%M %p on %A, %B %d, %Y')}."
-                else:
-                    return "Sorry, there was an error saving your event."
-            except (ValueError, pytz.exceptions.UnknownTimeZoneError) as e:
-                return f"Error scheduling event: Invalid {('timezone' if isinstance(e, pytz.exceptions.UnknownTimeZoneError) else 'time or date')} format."
-
-        # Command: !schedule list
-        if user_input.lower() == "!schedule list":
-            schedule = database.get_events(user_id)
-            if not schedule:
-                return "You have no upcoming scheduled events."
-                
-            response_lines = ["Your Upcoming Events:"]
-            for i, event in enumerate(schedule):
-                event_time = datetime.fromisoformat(event["event_time"]).astimezone(pytz.timezone(user_timezone))
-                response_lines.append(f"{i + 1}. {event['event_text']} at {self.format_datetime(event_time, user_timezone, '%I:%M %p on %A, %B %d, %Y')}")
-            return "\n".join(response_lines)
+        days = delta.days
+        hours, remainder = divmod(delta.seconds, 3600)
+        minutes = remainder // 60
+        response = f"Time until {offset_str}: "
+        parts = []
+        if days > 0:
+            parts.append(f"{days} day{'s' if days != 1 else ''}")
+        if hours > 0:
+            parts.append(f"{hours} hour{'s' if hours != 1 else ''}")
+        if minutes > 0:
+            parts.append(f"{minutes} minute{'s' if minutes != 1 else ''}")
+        return response + (", ".join(parts) or "less than a minute")
 
-        # Legacy support for original queries
-        if re.search(r"\bwhat time is it\b", user_input, re.IGNORECASE):
-            current_time = datetime.now(pytz.timezone(user_timezone))
-            return f"The current time in your timezone ({user_timezone}) is {self.format_datetime(current_time, user_timezone, '%I:%M %p')}."
+    # Command: !schedule <event> at <time> [on <date>] [in <timezone>]
+    def _cmd_schedule(self, fields, user_id, user_timezone):
+        event, time_str, date_str, timezone = fields
+        date_str = date_str or datetime.now().strftime("%m/%d/%Y")
+        timezone = timezone or user_timezone
         
-        if re.search(r"\bwhat is the date\b", user_input, re.IGNORECASE):
-            current_date = datetime.now(pytz.timezone(user_timezone))
-            return f"Today's date in your timezone ({user_timezone}) is {self.format_datetime(current_date, user_timezone, '%A, %B %d, %Y')}."
+        try:
+            tz = _tz(timezone)
+            naive_dt = datetime.strptime(f"{date_str} {time_str}", "%m/%d/%Y %I:%M %p")
+            event_time_local = tz.localize(naive_dt)
+            event_time_utc = event_time_local.astimezone(pytz.UTC)
 
-        return None
+            if database.add_event(user_id, event, event_time_utc.isoformat(timespec='seconds')):
+                self.bot.notify_scheduler_changed()
+                return f"📅 Scheduled: {event} at {self.format_datetime(event_time_local, timezone, _EVENT_FORMAT)}."
+            else:
+                return "Sorry, there was an error saving your event."
+        except (ValueError, pytz.exceptions.UnknownTimeZoneError) as e:
+            return f"Error scheduling event: Invalid {('timezone' if isinstance(e, pytz.exceptions.UnknownTimeZoneError) else 'time or date')} format."
+
+    # Command: !schedule list
+    def _cmd_schedule_list(self, match, user_id, user_timezone):
+        schedule = database.get_events(user_id)
+        if not schedule:
+            return "You have no upcoming scheduled events."
+            
+        tz = _tz(user_timezone)
+        response_lines = ["Your Upcoming Events:"]
+        for i, event in enumerate(schedule):
+            # Already converted to the user's zone, so format directly rather than via format_datetime
+            event_time = datetime.fromisoformat(event["event_time"]).astimezone(tz)
+            response_lines.append(f"{i + 1}. {event['event_text']} at {event_time.strftime(_EVENT_FORMAT)}")
+        return "\n".join(response_lines)
 
     def on_load(self):
         """Called when plugin is loaded. Registers help and shared services."""
         # Register a shared service for other plugins to use
         self.bot.services['datetime'] = {
-            'parse_date_offset': self.parse_date_offset
+            'parse_date_offset': self.parse_date_offset,
+            'get_user_timezone': self.get_user_timezone,
+            'timezone': _tz
         }
         self.bot.command_registry.register(
             "datetime_help",
-            lambda bot, args: (
-                "Date & Time Plugin Commands:\n"
-                "!time [in <timezone>] : Get current time\n"
-                "!date [in <timezone>] : Get current date\n"
-                "!settimezone <timezone> : Set your preferred timezone\n"
-                "!timeuntil <date or offset> : Calculate time until a date\n"
-                "!schedule <event> at <time> [on <MM/DD/YYYY>] [in <timezone>] : Schedule an event\n"
-                "!schedule list : List scheduled events\n"
-                "Examples:\n"
-                "  !time in America/New_York\n"
-                "  !timeuntil in 2 days\n"
-                "  !schedule Meeting at 2:30 pm on 12/31/2025 in Europe/London\n"
-                "  !settimezone Asia/Tokyo"
-            ),
+            lambda bot, args: _HELP,
             "Show date and time plugin help"
         )
 
@@ -1,27 +1,64 @@
+import queue
+import threading
 import requests
+from utils import HTTP_TIMEOUT
+
+_PREFETCH_SIZE = 5  # jokes kept ready once !joke has been used
 
 class Plugin:
     metadata = {
         "name": "Joke Teller",
         "version": "1.0",
-        "description": "Tells a random dad joke."
+        "description": "Tells a random dad joke.",
+        "commands": ["joke"]
     }
 
     def __init__(self, bot):
         self.bot = bot
+        # The bot's shared session keeps the connection alive between jokes
+        self.http = bot.http
+        self._jokes = queue.Queue(maxsize=_PREFETCH_SIZE)
+        self._prefetching = threading.Lock()  # held while a refill runs, so only one does
+
+    def _fetch_joke(self):
+        # The API requires a specific 'Accept' header to return JSON
+        response = self.http.get("https://icanhazdadjoke.com/", headers={"Accept": "application/json"}, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        return response.json()["joke"]
+
+    def _prefetch(self, target):
+        """Top the queue up to target jokes in the background; a failed fetch just leaves it short"""
+        try:
+            while self._jokes.qsize() < target:
+                self._jokes.put_nowait(self._fetch_joke())
+        except (requests.exceptions.RequestException, KeyError, ValueError, queue.Full):
+            pass
+        finally:
+            self._prefetching.release()
+
+    def _start_prefetch(self, target=_PREFETCH_SIZE):
+        if not self._prefetching.acquire(blocking=False):
+            return
+        try:
+            self.bot.executor.submit(self._prefetch, target)
+        except RuntimeError:  # The executor has been shut down
+            self._prefetching.release()
 
     def process(self, user_input, default_response):
-        if user_input.lower() != "!joke":
+        if self.bot.lowered(user_input) != "!joke":
             return None
 
         try:
-            # The API requires a specific 'Accept' header to return JSON
-            headers = {"Accept": "application/json"}
-            response = requests.get("https://icanhazdadjoke.com/", headers=headers)
-            response.raise_for_status()
-            
-            data = response.json()
-            return data["joke"]
-            
-        except requests.exceptions.RequestException as e:
-            return f"Sorry, I couldn't fetch a joke right now. Error: {e}"
\ No newline at end of file
+            joke = self._jokes.get_nowait()
+        except queue.Empty:
+            # Cold queue: answer first, and only start fetching ahead once that worked.
+            # The joke just told counts towards the batch, so one fewer is fetched ahead
+            try:
+                joke = self._fetch_joke()
+            except requests.exceptions.RequestException as e:
+                return f"Sorry, I couldn't fetch a joke right now. Error: {e}"
+            self._start_prefetch(_PREFETCH_SIZE - 1)
+            return joke
+        # Refill behind the answer, so the next !joke doesn't wait on the API
+        self._start_prefetch()
+        return joke
\ No newline at end of file
@@ -1,33 +1,54 @@
 import re
+import time
 import requests
+from utils import HTTP_TIMEOUT
+
+_NEWS_RE = re.compile(r"^!news(?: (.*))?$", re.IGNORECASE)
+_NEWS_TTL = 60  # seconds a set of headlines is reused for the same query
+_NEWS_URL = "https://newsapi.org/v2/top-headlines"
 
 class Plugin:
     metadata = {
         "name": "News Headlines Plugin",
         "version": "1.0",
-        "description": "Fetches top news headlines."
+        "description": "Fetches top news headlines.",
+        "commands": ["news"]
     }
 
     def __init__(self, bot):
         self.bot = bot
         # IMPORTANT: Replace "YOUR_API_KEY" with your actual NewsAPI key
         self.api_key = self.bot.config.get("api_keys", {}).get("news")
+        # The bot's shared session keeps the TLS connection to NewsAPI open between requests
+        self.http = bot.http
+        self._cache = {}  # lowercased query -> (monotonic time fetched, response text)
+        # Fixed query parameters; requests adds them (and escapes the search term) per call
+        self._base_params = {"country": "au", "pageSize": 5, "apiKey": self.api_key}
+        self.configured = False
+
+    def on_load(self):
+        """Called when plugin is loaded; the key check only needs to happen once"""
+        self.configured = bool(self.api_key) and self.api_key != "YOUR_API_KEY"
 
     def process(self, user_input, default_response):
-        match = re.match(r"^!news(?: (.*))?$", user_input, re.IGNORECASE)
+        match = _NEWS_RE.match(user_input)
         if not match:
             return None
             
-        if not self.api_key or self.api_key == "YOUR_API_KEY":
+        if not self.configured:
             return "News plugin is not configured. An API key is required."
 
         query = (match.group(1) or "").strip()
-        url = f"https://newsapi.org/v2/top-headlines?country=au&pageSize=5&apiKey={self.api_key}"
-        if query:
-            url += f"&q={query}" # Add search query if provided
+        cache_key = query.lower()
+        now = time.monotonic()
+        cached = self._cache.get(cache_key)
+        if cached and now - cached[0] < _NEWS_TTL:
+            return cached[1]
+
+        params = {**self._base_params, "q": query} if query else self._base_params
 
         try:
-            response = requests.get(url)
+            response = self.http.get(_NEWS_URL, params=params, headers={"Accept": "application/json"}, timeout=HTTP_TIMEOUT)
             response.raise_for_status()
             data = response.json()
             articles = data.get("articles", [])
@@ -38,7 +59,11 @@ class Plugin:
             response_lines = [f"Top 5 headlines{' for ' + query if query else ''}:"]
             for article in articles:
                 response_lines.append(f"- {article['title']}")
-            return "\n".join(response_lines)
+            result = "\n".join(response_lines)
+            # Drop expired entries so rarely repeated queries don't accumulate
+            self._cache = {k: v for k, v in self._cache.items() if now - v[0] < _NEWS_TTL}
+            self._cache[cache_key] = (now, result)
+            return result
 
         except requests.exceptions.RequestException as e:
             return f"Sorry, I couldn't fetch the news. Error: {e}"
\ No newline at end of file
@@ -2,11 +2,55 @@ import re
 from datetime import datetime
 import json
 
+_NOTE_ADD_RE = re.compile(r"^!note add (.*?)(?:\s+title:([\w\s]+))?(?:\s+category:([\w\s]+))?$", re.IGNORECASE)
+_NOTE_LIST_RE = re.compile(r"^!note list\s*(all|category:([\w\s]+))?$", re.IGNORECASE)
+_NOTE_SEARCH_RE = re.compile(r"^!note search (.*)", re.IGNORECASE)
+_NOTE_DELETE_RE = re.compile(r"^!note delete (\d+)", re.IGNORECASE)
+_NOTE_CLEAR_RE = re.compile(r"^!note clear\s*(all|category:([\w\s]+))?$", re.IGNORECASE)
+_CREATED_FORMAT = "%m/%d/%Y %I:%M %p"
+
+def _search_text(note):
+    """Lowercased title and text, stored on the note so searches don't re-fold it every time.
+    The newline can't occur in a keyword, so matches never span title and text."""
+    search_text = note.get("_search")
+    if search_text is None:
+        search_text = note["_search"] = f"{note['title']}\n{note['text']}".lower()
+    return search_text
+
+def _created_text(note):
+    """Display form of the creation time, stored on the note since it never changes"""
+    created_text = note.get("_created_human")
+    if created_text is None:
+        created_text = note["_created_human"] = datetime.fromisoformat(note["created"]).strftime(_CREATED_FORMAT)
+    return created_text
+
+def _category_key(item):
+    """Lowercased category, stored on the item so category filters don't re-fold it per call"""
+    cat_lower = item.get("_cat_lower")
+    if cat_lower is None:
+        cat_lower = item["_cat_lower"] = item["category"].lower()
+    return cat_lower
+
+_HELP = (
+    "Note Keeper Plugin Commands:\n"
+    "!note add <text> [title:<title>] [category:<category>] : Add a new note\n"
+    "!note list [all|category:<category>] : List notes\n"
+    "!note search <keyword> : Search notes by keyword\n"
+    "!note delete <number> : Delete a specific note\n"
+    "!note clear [all|category:<category>] : Clear notes\n"
+    "Examples:\n"
+    "  !note add Remember to call Alice title:Reminder category:Personal\n"
+    "  !note list category:Personal\n"
+    "  !note search Alice\n"
+    "  !note delete 1"
+)
+
 class Plugin:
     metadata = {
         "name": "Note Keeper Plugin",
         "version": "2.0",
-        "description": "Manages user notes with titles, categories, timestamps, and search functionality."
+        "description": "Manages user notes with titles, categories, timestamps, and search functionality.",
+        "commands": ["note"]
     }
 
     def __init__(self, bot):
@@ -14,42 +58,48 @@ class Plugin:
 
     def process(self, user_input, default_response):
         """Process user input for note-related commands"""
+        # Every command starts with !note; skip the regexes (and the user lookup) otherwise
+        if user_input[:5].lower() != "!note":
+            return None
         user_id = self.bot.config["default_user_id"]
         user_data = self.bot.memory["knowledge"]["users"].setdefault(user_id, {})
         
         user_data.setdefault("notes", [])
 
         # Command: !note add <text> [title:<title>] [category:<category>]
-        add_match = re.match(
-            r"^!note add (.*?)(?:\s+title:([\w\s]+))?(?:\s+category:([\w\s]+))?$",
-            user_input,
-            re.IGNORECASE
-        )
+        add_match = _NOTE_ADD_RE.match(user_input)
         if add_match:
-            note_text = add_match.group(1).strip()
-            title = add_match.group(2).strip() if add_match.group(2) else "Untitled"
-            category = add_match.group(3).strip() if add_match.group(3) else "General"
+            note_text, title, category = add_match.groups()
+            note_text = note_text.strip()
+            title = title.strip() if title else "Untitled"
+            category = category.strip() if category else "General"
             
             if not note_text:
                 return "Please provide note content."
             
+            created = datetime.now()
             note_data = {
                 "text": note_text,
                 "title": title,
                 "category": category,
-                "created": datetime.now().isoformat()
+                "_cat_lower": category.lower(),
+                "created": created.isoformat(),
+                "_created_human": created.strftime(_CREATED_FORMAT)
             }
+            _search_text(note_data)
             user_data["notes"].append(note_data)
-            self.bot.save_memory()
+            self.bot.mark_dirty()
             
             response = f"🗒️ Note saved: \"{title}\" (Category: {category})"
             return response
 
         # Command: !note list [all|category:<category>]
-        list_match = re.match(r"^!note list\s*(all|category:([\w\s]+))?$", user_input, re.IGNORECASE)
+        list_match = _NOTE_LIST_RE.match(user_input)
         if list_match:
-            filter_type = list_match.group(1).lower() if list_match.group(1) else "all"
-            category = list_match.group(2).strip() if list_match.group(2) else None
+            filter_type, category = list_match.groups()
+            # filter_type holds the whole "category:<name>" text then, so name it explicitly
+            category = category.strip() if category else None
+            filter_type = "category" if category else (filter_type.lower() if filter_type else "all")
             notes = user_data["notes"]
             
             if not notes:
@@ -57,51 +107,47 @@ class Plugin:
                 
             filtered_notes = notes
             if filter_type == "category":
-                filtered_notes = [n for n in notes if n["category"].lower() == category.lower()]
+                target = category.lower()
+                filtered_notes = [n for n in notes if _category_key(n) == target]
             
             if not filtered_notes:
                 return f"No notes found for category: {category}."
                 
             response_lines = [f"Your Notes ({filter_type}{' ' + category if category else ''}):"]
             for i, note in enumerate(filtered_notes):
-                created_date = datetime.fromisoformat(note["created"]).strftime("%m/%d/%Y %I:%M %p")
-                line = f"{i + 1}. {note['title']} (Category: {note['category']}, Created: {created_date})"
+                line = f"{i + 1}. {note['title']} (Category: {note['category']}, Created: {_created_text(note)})"
                 line += f"\n   {note['text']}"
                 response_lines.append(line)
             return "\n".join(response_lines)
 
         # Command: !note search <keyword>
-        search_match = re.match(r"^!note search (.*)", user_input, re.IGNORECASE)
+        search_match = _NOTE_SEARCH_RE.match(user_input)
         if search_match:
             keyword = search_match.group(1).strip().lower()
             if not keyword:
                 return "Please provide a search keyword."
                 
             notes = user_data["notes"]
-            matching_notes = [
-                n for n in notes
-                if keyword in n["text"].lower() or keyword in n["title"].lower()
-            ]
+            matching_notes = [n for n in notes if keyword in _search_text(n)]
             
             if not matching_notes:
                 return f"No notes found containing '{keyword}'."
                 
             response_lines = [f"Notes containing '{keyword}':"]
             for i, note in enumerate(matching_notes):
-                created_date = datetime.fromisoformat(note["created"]).strftime("%m/%d/%Y %I:%M %p")
-                line = f"{i + 1}. {note['title']} (Category: {note['category']}, Created: {created_date})"
+                line = f"{i + 1}. {note['title']} (Category: {note['category']}, Created: {_created_text(note)})"
                 line += f"\n   {note['text']}"
                 response_lines.append(line)
             return "\n".join(response_lines)
 
         # Command: !note delete <number>
-        delete_match = re.match(r"^!note delete (\d+)", user_input, re.IGNORECASE)
+        delete_match = _NOTE_DELETE_RE.match(user_input)
         if delete_match:
             try:
                 note_number = int(delete_match.group(1))
                 if 1 <= note_number <= len(user_data["notes"]):
                     deleted_note = user_data["notes"].pop(note_number - 1)
-                    self.bot.save_memory()
+                    self.bot.mark_dirty()
                     return f"🗑️ Deleted note: \"{deleted_note['title']}\""
                 else:
                     return "Invalid note number."
@@ -109,18 +155,22 @@ class Plugin:
                 return "Please provide a valid number."
 
         # Command: !note clear [all|category:<category>]
-        clear_match = re.match(r"^!note clear\s*(all|category:([\w\s]+))?$", user_input, re.IGNORECASE)
+        clear_match = _NOTE_CLEAR_RE.match(user_input)
         if clear_match:
-            clear_type = clear_match.group(1).lower() if clear_match.group(1) else "all"
-            category = clear_match.group(2).strip() if clear_match.group(2) else None
+            clear_type, category = clear_match.groups()
+            # clear_type holds the whole "category:<name>" text then, so name it explicitly
+            category = category.strip() if category else None
+            clear_type = "category" if category else (clear_type.lower() if clear_type else "all")
             
             if clear_type == "all":
                 user_data["notes"] = []
+                # Rare and destructive, so written straight away rather than batched
                 self.bot.save_memory()
                 return "🗑️ Cleared all notes!"
             elif clear_type == "category":
-                user_data["notes"] = [n for n in user_data["notes"] if n["category"].lower() != category.lower()]
-                self.bot.save_memory()
+                target = category.lower()
+                user_data["notes"] = [n for n in user_data["notes"] if _category_key(n) != target]
+                self.bot.mark_dirty()
                 return f"🗑️ Cleared all notes in category: {category}!"
 
         return None
@@ -129,22 +179,10 @@ class Plugin:
         """Called when plugin is loaded"""
         self.bot.command_registry.register(
             "note_help",
-            lambda bot, args: (
-                "Note Keeper Plugin Commands:\n"
-                "!note add <text> [title:<title>] [category:<category>] : Add a new note\n"
-                "!note list [all|category:<category>] : List notes\n"
-                "!note search <keyword> : Search notes by keyword\n"
-                "!note delete <number> : Delete a specific note\n"
-                "!note clear [all|category:<category>] : Clear notes\n"
-                "Examples:\n"
-                "  !note add Remember to call Alice title:Reminder category:Personal\n"
-                "  !note list category:Personal\n"
-                "  !note search Alice\n"
-                "  !note delete 1"
-            ),
+            lambda bot, args: _HELP,
             "Show note keeper plugin help"
         )
 
     def on_unload(self):
         """Called when plugin is unloaded"""
-        pass
\ No newline at end of file
+        self.bot.flush_memory()
\ No newline at end of file
@@ -1,53 +1,115 @@
 # plugins/todo_plugin.py
 import re
+import time
 from datetime import datetime, timedelta
 import json
 import database
 import pytz
 
+_TODO_ADD_RE = re.compile(
+    r"^!todo add (.*?)(?:\s+priority:(high|medium|low))?(?:\s+due:(.+?))?(?:\s+category:([\w\s]+))?$",
+    re.IGNORECASE
+)
+_TODO_LIST_RE = re.compile(r"^!todo list\s*(all|pending|category:([\w\s]+)|overdue)?$", re.IGNORECASE)
+_TODO_DONE_RE = re.compile(r"^!todo done (\d+)", re.IGNORECASE)
+_TODO_REMOVE_RE = re.compile(r"^!todo remove (\d+)", re.IGNORECASE)
+_TODO_CLEAR_RE = re.compile(r"^!todo clear\s*(all|completed|category:([\w\s]+))?$", re.IGNORECASE)
+
+def _due_ts(task):
+    """Due time as integer epoch seconds, or None. Tasks saved before timestamps were
+    stored as integers carry an ISO "due_date" instead; it is converted on first use."""
+    due_ts = task.get("due_ts")
+    if due_ts is None and "due_date" in task:
+        try:
+            due_ts = int(datetime.fromisoformat(task["due_date"]).timestamp())
+        except (ValueError, TypeError):
+            return None  # Left in place, so an unreadable date isn't dropped on the next save
+        task["due_ts"] = due_ts
+        del task["due_date"]
+    return due_ts
+
+def _category_key(item):
+    """Lowercased category, stored on the item so category filters don't re-fold it per call"""
+    cat_lower = item.get("_cat_lower")
+    if cat_lower is None:
+        cat_lower = item["_cat_lower"] = item["category"].lower()
+    return cat_lower
+
+_HELP = (
+    "To-Do List Plugin Commands:\n"
+    "!todo add <task> [priority:h|m|l] [due:<date>] [category:<name>] : Add a new task\n"
+    "!todo list [all|pending|category:<name>|overdue] : List tasks\n"
+    "!todo done <number> : Mark a PENDING task as completed\n"
+    "!todo remove <number> : Remove a task by its overall list number\n"
+    "!todo clear [all|completed|category:<name>] : Clear tasks\n"
+    "Examples:\n"
+    "  !todo add Finish report due:in 2 days category:Work\n"
+    "  !todo list category:Work\n"
+    "  !todo done 1"
+)
+
 class Plugin:
     metadata = {
         "name": "To-Do List Plugin",
         "version": "2.1",
-        "description": "Manages a user's to-do list with priorities, due dates, categories, and automatic reminders."
+        "description": "Manages a user's to-do list with priorities, due dates, categories, and automatic reminders.",
+        "commands": ["todo"]
     }
 
     def __init__(self, bot):
         self.bot = bot
+        # (todo_list it was built from, that list's length then, its pending tasks in order).
+        # Replacing the list (clear, !clear) invalidates it by identity, and a length change
+        # catches edits made elsewhere; this plugin's own edits keep it updated.
+        self._pending_cache = (None, 0, None)
+
+    def _pending_tasks(self, todo_list):
+        """Pending tasks of todo_list, in list order, rebuilt only when the cache is stale"""
+        cached_list, cached_len, pending = self._pending_cache
+        if cached_list is not todo_list or cached_len != len(todo_list):
+            pending = [t for t in todo_list if not t.get("completed")]
+            self._pending_cache = (todo_list, len(todo_list), pending)
+        return pending
 
-    def format_due_date(self, iso_date):
-        """Format ISO date to readable MM/DD/YYYY"""
+    def user_timezone(self):
+        """The user's tzinfo, resolved through the datetime plugin when it is loaded"""
+        user_timezone_str = self.bot.config.get("default_timezone", "UTC")
+        datetime_service = self.bot.services.get('datetime')
+        if datetime_service:
+            user_timezone_str = datetime_service['get_user_timezone'](self.bot.config["default_user_id"])
+            # The datetime plugin's resolver caches zone lookups across calls
+            return datetime_service['timezone'](user_timezone_str)
+        return pytz.timezone(user_timezone_str)
+
+    def format_due_date(self, due_ts, user_timezone=None):
+        """Format an epoch-seconds due time to readable MM/DD/YYYY.
+        Pass user_timezone when formatting many tasks so it is resolved only once."""
         try:
-            # Assumes iso_date is a UTC string from the database/parser
-            user_timezone_str = self.bot.config.get("default_timezone", "UTC")
-            if 'datetime' in self.bot.services:
-                 user_timezone_str = self.bot.services['datetime'].get_user_timezone(self.bot.config["default_user_id"])
-            
-            user_timezone = pytz.timezone(user_timezone_str)
-            dt_utc = datetime.fromisoformat(iso_date)
-            dt_local = dt_utc.astimezone(user_timezone)
+            if user_timezone is None:
+                user_timezone = self.user_timezone()
+            dt_local = datetime.fromtimestamp(due_ts, user_timezone)
             return dt_local.strftime("%m/%d/%Y")
-        except (ValueError, TypeError):
+        except (ValueError, TypeError, OverflowError, OSError):
             return "Invalid date"
 
     def process(self, user_input, default_response):
         """Process user input for to-do list commands"""
+        # Every command starts with !todo; skip the regexes (and the user lookup) otherwise
+        if user_input[:5].lower() != "!todo":
+            return None
         user_id = self.bot.config["default_user_id"]
         user_data = self.bot.memory["knowledge"]["users"].setdefault(user_id, {})
         
         user_data.setdefault("todo_list", [])
 
         # Command: !todo add <task> [priority:high|medium|low] [due:<date>] [category:<category>]
-        add_match = re.match(
-            r"^!todo add (.*?)(?:\s+priority:(high|medium|low))?(?:\s+due:(.+?))?(?:\s+category:([\w\s]+))?$",
-            user_input,
-            re.IGNORECASE
-        )
+        add_match = _TODO_ADD_RE.match(user_input)
         if add_match:
-            task = add_match.group(1).strip()
-            priority = add_match.group(2).lower() if add_match.group(2) else "medium"
-            due_str = add_match.group(3).strip() if add_match.group(3) else None
-            category = add_match.group(4).strip() if add_match.group(4) else "General"
+            task, priority, due_str, category = add_match.groups()
+            task = task.strip()
+            priority = priority.lower() if priority else "medium"
+            due_str = due_str.strip() if due_str else None
+            category = category.strip() if category else "General"
             
             if not task:
                 return "Please provide a task description."
@@ -56,7 +118,8 @@ class Plugin:
                 "task": task,
                 "priority": priority,
                 "category": category,
-                "created": datetime.now().isoformat()
+                "_cat_lower": category.lower(),
+                "created_ts": int(time.time())
             }
 
             # --- NEW INTEROPERABILITY LOGIC ---
@@ -65,53 +128,63 @@ class Plugin:
                 target_date_utc = self.bot.services['datetime']['parse_date_offset'](due_str)
                 
                 if target_date_utc:
-                    due_date_iso = target_date_utc.isoformat()
-                    task_data["due_date"] = due_date_iso
+                    task_data["due_ts"] = int(target_date_utc.timestamp())
                     # Automatically schedule a reminder in the database
                     reminder_text = f"To-Do Reminder: {task}"
-                    database.add_event(user_id, reminder_text, due_date_iso)
+                    if database.add_event(user_id, reminder_text, target_date_utc.isoformat(timespec='seconds')):
+                        self.bot.notify_scheduler_changed()
                 else:
                     return f"Sorry, I couldn't understand the due date '{due_str}'."
             # --- END NEW LOGIC ---
                 
-            user_data["todo_list"].append(task_data)
-            self.bot.save_memory()
+            todo_list = user_data["todo_list"]
+            cached_list, cached_len, pending = self._pending_cache
+            if cached_list is todo_list and cached_len == len(todo_list):
+                pending.append(task_data)
+                self._pending_cache = (todo_list, cached_len + 1, pending)
+            todo_list.append(task_data)
+            self.bot.mark_dirty()
             
             response = f"✅ Added: \"{task}\" (Priority: {priority}, Category: {category}"
-            if "due_date" in task_data:
-                response += f", Due: {self.format_due_date(task_data['due_date'])}"
+            if "due_ts" in task_data:
+                response += f", Due: {self.format_due_date(task_data['due_ts'])}"
                 response += ", Reminder set!"
             response += ")"
             return response
 
         # Command: !todo list [all|pending|category:<category>|overdue]
-        list_match = re.match(r"^!todo list\s*(all|pending|category:([\w\s]+)|overdue)?$", user_input, re.IGNORECASE)
+        list_match = _TODO_LIST_RE.match(user_input)
         if list_match:
-            filter_type = list_match.group(1).lower() if list_match.group(1) else "pending"
-            category = list_match.group(2).strip() if list_match.group(2) else None
+            filter_type, category = list_match.groups()
+            # filter_type holds the whole "category:<name>" text then, so name it explicitly
+            category = category.strip() if category else None
+            filter_type = "category" if category else (filter_type.lower() if filter_type else "pending")
             todo_list = user_data["todo_list"]
             
             if not todo_list:
                 return "Your to-do list is empty!"
                 
             filtered_tasks = todo_list
-            now_iso = datetime.now().isoformat()
+            now_ts = time.time()
             
             if filter_type == "pending":
-                filtered_tasks = [t for t in todo_list if "completed" not in t or not t["completed"]]
+                filtered_tasks = self._pending_tasks(todo_list)
             elif filter_type == "category":
-                filtered_tasks = [t for t in todo_list if t["category"].lower() == category.lower()]
+                target = category.lower()
+                filtered_tasks = [t for t in todo_list if _category_key(t) == target]
             elif filter_type == "overdue":
-                filtered_tasks = [t for t in todo_list if "due_date" in t and t["due_date"] < now_iso and ("completed" not in t or not t["completed"])]
+                filtered_tasks = [t for t in self._pending_tasks(todo_list) if (due_ts := _due_ts(t)) is not None and due_ts < now_ts]
 
             if not filtered_tasks:
                 return f"No tasks found for {filter_type}{' ' + category if category else ''}."
                 
+            user_timezone = self.user_timezone()
             response_lines = [f"Your To-Do List ({filter_type}{' ' + category if category else ''}):"]
             for i, task in enumerate(filtered_tasks):
                 line = f"{i + 1}. {task['task']} (Priority: {task['priority']}, Category: {task['category']}"
-                if "due_date" in task:
-                    line += f", Due: {self.format_due_date(task['due_date'])}"
+                due_ts = _due_ts(task)
+                if due_ts is not None:
+                    line += f", Due: {self.format_due_date(due_ts, user_timezone)}"
                 if "completed" in task and task["completed"]:
                     line += ", Completed"
                 line += ")"
@@ -119,16 +192,16 @@ class Plugin:
             return "\n".join(response_lines)
 
         # Command: !todo done <number>
-        done_match = re.match(r"^!todo done (\d+)", user_input, re.IGNORECASE)
+        done_match = _TODO_DONE_RE.match(user_input)
         if done_match:
             try:
                 task_number = int(done_match.group(1))
-                pending_tasks = [t for t in user_data["todo_list"] if not t.get("completed")]
+                pending_tasks = self._pending_tasks(user_data["todo_list"])
                 if 1 <= task_number <= len(pending_tasks):
-                    task_to_complete = pending_tasks[task_number - 1]
+                    task_to_complete = pending_tasks.pop(task_number - 1)
                     task_to_complete["completed"] = True
                     task_to_complete["completed_date"] = datetime.now().isoformat()
-                    self.bot.save_memory()
+                    self.bot.mark_dirty()
                     return f"👍 Great job! Completed: \"{task_to_complete['task']}\""
                 else:
                     return "Invalid task number. Please use the number from the '!todo list pending' command."
@@ -136,13 +209,14 @@ class Plugin:
                 return "Please provide a valid number."
 
         # Command: !todo remove <number>
-        remove_match = re.match(r"^!todo remove (\d+)", user_input, re.IGNORECASE)
+        remove_match = _TODO_REMOVE_RE.match(user_input)
         if remove_match:
             try:
                 task_number = int(remove_match.group(1))
                 if 1 <= task_number <= len(user_data["todo_list"]):
                     removed_task = user_data["todo_list"].pop(task_number - 1)
-                    self.bot.save_memory()
+                    self._pending_cache = (None, 0, None)
+                    self.bot.mark_dirty()
                     return f"🗑️ Removed from your list: \"{removed_task['task']}\""
                 else:
                     return "Invalid task number."
@@ -150,24 +224,28 @@ class Plugin:
                 return "Please provide a valid number."
 
         # Command: !todo clear [all|completed|category:<category>]
-        clear_match = re.match(r"^!todo clear\s*(all|completed|category:([\w\s]+))?$", user_input, re.IGNORECASE)
+        clear_match = _TODO_CLEAR_RE.match(user_input)
         if clear_match:
-            clear_type = clear_match.group(1).lower() if clear_match.group(1) else "completed"
-            category = clear_match.group(2).strip() if clear_match.group(2) else None
+            clear_type, category = clear_match.groups()
+            # clear_type holds the whole "category:<name>" text then, so name it explicitly
+            category = category.strip() if category else None
+            clear_type = "category" if category else (clear_type.lower() if clear_type else "completed")
             
             if clear_type == "all":
                 user_data["todo_list"] = []
+                # Rare and destructive, so written straight away rather than batched
                 self.bot.save_memory()
                 return "🗑️ Cleared all tasks from your to-do list!"
             elif clear_type == "completed":
                 user_data["todo_list"] = [t for t in user_data["todo_list"] if not t.get("completed")]
-                self.bot.save_memory()
+                self.bot.mark_dirty()
                 return "🗑️ Cleared all completed tasks from your to-do list!"
             elif clear_type == "category":
                 initial_count = len(user_data["todo_list"])
-                user_data["todo_list"] = [t for t in user_data["todo_list"] if t["category"].lower() != category.lower()]
+                target = category.lower()
+                user_data["todo_list"] = [t for t in user_data["todo_list"] if _category_key(t) != target]
                 removed_count = initial_count - len(user_data["todo_list"])
-                self.bot.save_memory()
+                self.bot.mark_dirty()
                 return f"🗑️ Cleared {removed_count} task(s) in category: {category}!"
 
         return None
@@ -176,21 +254,10 @@ class Plugin:
         """Called when plugin is loaded"""
         self.bot.command_registry.register(
             "todo_help",
-            lambda bot, args: (
-                "To-Do List Plugin Commands:\n"
-                "!todo add <task> [priority:h|m|l] [due:<date>] [category:<name>] : Add a new task\n"
-                "!todo list [all|pending|category:<name>|overdue] : List tasks\n"
-                "!todo done <number> : Mark a PENDING task as completed\n"
-                "!todo remove <number> : Remove a task by its overall list number\n"
-                "!todo clear [all|completed|category:<name>] : Clear tasks\n"
-                "Examples:\n"
-                "  !todo add Finish report due:in 2 days category:Work\n"
-                "  !todo list category:Work\n"
-                "  !todo done 1"
-            ),
+            lambda bot, args: _HELP,
             "Show to-do list plugin help"
         )
 
     def on_unload(self):
         """Called when plugin is unloaded"""
-        pass
\ No newline at end of file
+        self.bot.flush_memory()
\ No newline at end of file
@@ -1,14 +1,21 @@
 # plugins/trivia_plugin.py
-import re
 import requests
+from utils import HTTP_TIMEOUT
 import random
-from bs4 import BeautifulSoup
+import threading
+from collections import deque
+from html import unescape
+
+_ANSWER_PREFIX = "!answer "
+_BATCH_SIZE = 10  # questions fetched per API call; the spares answer later !trivia calls
+_REFILL_BELOW = 2  # refill in the background once fewer spares than this remain
 
 class Plugin:
     metadata = {
         "name": "Trivia Game Plugin",
         "version": "1.0",
-        "description": "An interactive trivia game."
+        "description": "An interactive trivia game.",
+        "commands": ["trivia", "answer"]
     }
 
     def __init__(self, bot):
@@ -16,21 +23,54 @@ class Plugin:
         self.current_question = None
         self.current_answers = []
         self.correct_answer = None
+        # The bot's pooled, retrying session, shared with the other plugins
+        self.http = bot.http
+        self._question_pool = deque()  # raw API results not asked yet
+        self._refilling = threading.Lock()  # held while a background refill runs
+
+    def _fetch_questions(self):
+        response = self.http.get(f"https://opentdb.com/api.php?amount={_BATCH_SIZE}&type=multiple", timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        return response.json()["results"]
+
+    def _refill(self):
+        try:
+            self._question_pool.extend(self._fetch_questions())
+        except (requests.exceptions.RequestException, KeyError, ValueError):
+            pass  # The next !trivia fetches synchronously instead
+        finally:
+            self._refilling.release()
+
+    def _start_refill(self):
+        if len(self._question_pool) >= _REFILL_BELOW or not self._refilling.acquire(blocking=False):
+            return
+        try:
+            self.bot.executor.submit(self._refill)
+        except RuntimeError:  # The executor has been shut down
+            self._refilling.release()
 
     def ask_new_question(self):
         """Fetches a new trivia question from the Open Trivia Database."""
         try:
-            response = requests.get("https://opentdb.com/api.php?amount=1&type=multiple")
-            response.raise_for_status()
-            data = response.json()["results"][0]
+            try:
+                data = self._question_pool.popleft()
+            except IndexError:
+                # Nothing prefetched: fetch a batch now, ask the first and keep the rest
+                results = self._fetch_questions()
+                if not results:
+                    return "Sorry, I couldn't fetch a trivia question right now. Please try again."
+                data = results[0]
+                self._question_pool.extend(results[1:])
+            self._start_refill()
             
-            self.current_question = BeautifulSoup(data["question"], "html.parser").text
+            # The API HTML-escapes its text; only entities need decoding, not a parse tree
+            self.current_question = unescape(data["question"])
             
             answers = data["incorrect_answers"]
             answers.append(data["correct_answer"])
             random.shuffle(answers)
-            self.current_answers = [BeautifulSoup(a, "html.parser").text for a in answers]
-            self.correct_answer = BeautifulSoup(data["correct_answer"], "html.parser").text
+            self.current_answers = [unescape(a) for a in answers]
+            self.correct_answer = unescape(data["correct_answer"])
 
             response_text = f"Here is your trivia question:\n\n{self.current_question}\n\n"
             for i, answer in enumerate(self.current_answers):
@@ -41,20 +81,21 @@ class Plugin:
             return f"Sorry, I couldn't fetch a trivia question. Error: {e}"
 
     def process(self, user_input, default_response):
-        user_input_lower = user_input.lower()
+        if not user_input.startswith("!"):
+            return None
+        user_input_lower = self.bot.lowered(user_input)
 
         # Command: !trivia
         if user_input_lower == "!trivia":
             return self.ask_new_question()
 
-        # Command: !answer <number>
-        answer_match = re.match(r"^!answer (\d+)$", user_input_lower)
-        if answer_match:
+        # Command: !answer <number>; a prefix check rules out every other message first
+        if user_input_lower.startswith(_ANSWER_PREFIX) and user_input_lower[len(_ANSWER_PREFIX):].isdecimal():
             if not self.current_question:
                 return "There is no active trivia question. Type `!trivia` to start a new game."
             
             try:
-                choice_index = int(answer_match.group(1)) - 1
+                choice_index = int(user_input_lower[len(_ANSWER_PREFIX):]) - 1
                 if 0 <= choice_index < len(self.current_answers):
                     chosen_answer = self.current_answers[choice_index]
                     
@@ -1,31 +1,43 @@
 import re
 import requests
+from utils import HTTP_TIMEOUT
+
+# Matched against the lowercased input
+_WEATHER_RE = re.compile(r"^!weather(?: (.*))?$")
 
 class Plugin:
     metadata = {
         "name": "Live Weather Plugin",
         "version": "1.0",
-        "description": "Fetches the current weather for a location."
+        "description": "Fetches the current weather for a location.",
+        "commands": ["weather"]
     }
 
     def __init__(self, bot):
         self.bot = bot
         # IMPORTANT: Replace "YOUR_API_KEY" with your actual OpenWeatherMap API key
         self.api_key = self.bot.config.get("api_keys", {}).get("weather")
+        # The bot's pooled, retrying session, shared with the other plugins
+        self.http = bot.http
 
     def process(self, user_input, default_response):
-        match = re.match(r"^!weather(?: (.*))?$", user_input, re.IGNORECASE)
+        # Most messages aren't weather requests; rule them out before the regex runs
+        user_input_lower = self.bot.lowered(user_input)
+        if not user_input_lower.startswith("!weather"):
+            return None
+        match = _WEATHER_RE.match(user_input_lower)
         if not match:
             return None
         
         if not self.api_key or self.api_key == "YOUR_API_KEY":
             return "Weather plugin is not configured. An API key is required."
 
-        location = (match.group(1) or "Marsden, AU").strip()
+        # Taken from the original text (after "!weather ") to keep the user's capitalisation
+        location = (user_input[9:] if match.group(1) is not None else "Marsden, AU").strip()
         url = f"http://api.openweathermap.org/data/2.5/weather?q={location}&appid={self.api_key}&units=metric"
 
         try:
-            response = requests.get(url)
+            response = self.http.get(url, timeout=HTTP_TIMEOUT)
             response.raise_for_status() # Raise an exception for bad status codes
             data = response.json()
             
@@ -37,7 +49,8 @@ class Plugin:
             return f"The weather in {city}, {country} is currently {temp}°C with {weather_desc}."
 
         except requests.exceptions.RequestException as e:
-            if response.status_code == 404:
+            # The response is unset if the request never completed (timeout, DNS failure)
+            if e.response is not None and e.response.status_code == 404:
                 return f"Sorry, I couldn't find the weather for '{location}'. Please check the location."
             return f"Sorry, I couldn't fetch the weather data. Error: {e}"
         except Exception as e:
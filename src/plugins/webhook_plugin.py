@@ -1,64 +1,124 @@
 # plugins/webhook_plugin.py
+import asyncio
 import threading
-from flask import Flask, request, jsonify
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+import uvicorn
 import logging
 import queue
+from collections import deque
+from utils import dumps_bytes, loads
 
 logger = logging.getLogger(__name__)
 
+_QUEUE_SIZE = 1024  # pending notifications kept; the oldest are dropped beyond this
+
+class SPSCQueue:
+    """Single-producer, single-consumer queue with the queue.Queue calls the GUI uses.
+
+    deque.append and deque.popleft are each atomic, so one producer thread (the server)
+    and one consumer thread (the GUI) need no lock around them. Being bounded, it also
+    can't grow without limit when nothing consumes it (console and service modes).
+    """
+
+    def __init__(self, maxlen=_QUEUE_SIZE):
+        self._items = deque(maxlen=maxlen)
+
+    def put_nowait(self, item):
+        self._items.append(item)
+
+    put = put_nowait
+
+    def get_nowait(self):
+        try:
+            return self._items.popleft()
+        except IndexError:
+            raise queue.Empty from None
+
+    def qsize(self):
+        return len(self._items)
+
+    def empty(self):
+        return not self._items
+
 class Plugin:
     metadata = {
         "name": "Webhook Listener Plugin",
-        "version": "1.2",
-        "description": "Listens for incoming webhooks and uses a queue for GUI communication."
+        "version": "1.3",
+        "description": "Listens for incoming webhooks and uses a queue for GUI communication.",
+        "commands": ["webhook"]
     }
 
     def __init__(self, bot):
         self.bot = bot
         self.host = "0.0.0.0"
         self.port = 5001
-        # Create a thread-safe queue for messages
-        self.webhook_queue = queue.Queue()
-
-    def _start_flask_app(self):
-        app = Flask(__name__)
-        app.logger.disabled = True
-        werkzeug_logger = logging.getLogger('werkzeug')
-        werkzeug_logger.disabled = True
-
-        @app.route('/webhook', methods=['POST'])
-        def handle_webhook():
-            logger.debug("Received webhook request")  # Changed to DEBUG for more granularity
-            try:
-                data = request.get_json()
-                logger.debug(f"Webhook data received: {data}")
-                if "series" in data and "episodes" in data:
-                    message = f"Sonarr: Downloaded '{data['series']['title']} - {data['episodes'][0]['title']}'"
-                elif "movie" in data:
-                    message = f"Radarr: Downloaded '{data['movie']['title']}'"
-                else:
-                    message = f"Webhook Received: {str(data)[:200]}"
-                logger.debug(f"Putting message in queue: {message}")
-                self.webhook_queue.put(f"🔌 {message}")
-                logger.debug(f"Queue size after put: {self.webhook_queue.qsize()}")
-                return jsonify({"status": "success"}), 200
-            except Exception as e:
-                logger.error(f"Error processing webhook: {e}", exc_info=True)
-                return jsonify({"status": "error", "message": str(e)}), 400
+        # The queue and its consumer live in bot.services rather than on the instance,
+        # so the GUI wired to them at startup keeps receiving after !reload.
+        # 'on_message' is an optional callable run on the server thread after each put,
+        # so the consumer can be woken instead of polling (the GUI's webhook_ready signal)
+        self.service = self.bot.services.setdefault('webhook', {
+            'queue': SPSCQueue(),
+            'on_message': None
+        })
+        self.webhook_queue = self.service['queue']
+        self._server = None  # uvicorn.Server, once the listener thread has started it
+        self._server_thread = None
 
+    async def _handle(self, request):
+        logger.debug("Received webhook request")  # Changed to DEBUG for more granularity
         try:
-            app.run(host=self.host, port=self.port, debug=False)
+            data = loads(await request.body())
+            # %s arguments are only formatted if a DEBUG record is actually emitted
+            logger.debug("Webhook data received: %s", data)
+            if "series" in data and "episodes" in data:
+                message = f"Sonarr: Downloaded '{data['series']['title']} - {data['episodes'][0]['title']}'"
+            elif "movie" in data:
+                message = f"Radarr: Downloaded '{data['movie']['title']}'"
+            else:
+                message = f"Webhook Received: {str(data)[:200]}"
+            logger.debug("Putting message in queue: %s", message)
+            self.webhook_queue.put_nowait(f"🔌 {message}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Queue size after put: %s", self.webhook_queue.qsize())
+            on_message = self.service['on_message']
+            if on_message is not None:
+                on_message()
+            return Response(dumps_bytes({"status": "success"}), status_code=200, media_type="application/json")
         except Exception as e:
-            logger.error(f"Flask server failed to start: {e}")
+            logger.error(f"Error processing webhook: {e}", exc_info=True)
+            return Response(dumps_bytes({"status": "error", "message": str(e)}), status_code=400, media_type="application/json")
+
+    async def _serve(self):
+        # One event loop handles every request; the handler never blocks, it only enqueues
+        app = Starlette(routes=[Route('/webhook', self._handle, methods=['POST'])])
+        config = uvicorn.Config(app, host=self.host, port=self.port, log_level='error', access_log=False)
+        self._server = uvicorn.Server(config)
+        await self._server.serve()
+
+    def _run_server(self):
+        try:
+            asyncio.run(self._serve())
+        except (Exception, SystemExit) as e:  # uvicorn exits the thread if it can't bind
+            logger.error(f"Webhook server failed to start: {e}")
 
     def on_load(self):
         logger.info("Starting Webhook Listener server...")
-        flask_thread = threading.Thread(target=self._start_flask_app, daemon=True)
-        flask_thread.start()
+        self._server_thread = threading.Thread(target=self._run_server, daemon=True)
+        self._server_thread.start()
         logger.info(f"Webhook server is listening on http://{self.host}:{self.port}/webhook")
 
+    def on_unload(self):
+        # Lets !reload bind the port again instead of leaving the old server running
+        if self._server is not None:
+            self._server.should_exit = True
+        if self._server_thread is not None:
+            # Wait for the socket to close so the reloaded instance can bind the same port
+            self._server_thread.join(timeout=5)
+
     def process(self, user_input, default_response):
-        if user_input.lower() == "!webhook url":
+        if self.bot.lowered(user_input) == "!webhook url":
             return (f"Webhook URL for local testing: http://localhost:{self.port}/webhook\n"
                     f"Use your machine's local IP for other devices on your network.")
         return None
\ No newline at end of file
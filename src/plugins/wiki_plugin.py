@@ -1,20 +1,70 @@
+import logging
+import os
 import re
+import threading
+import time
 import wikipediaapi
-from datetime import datetime, timedelta
-import json
+from datetime import datetime
+from itertools import islice
+from utils import dumps_bytes, loads
+
+logger = logging.getLogger(__name__)
+
+# Language editions accepted by !setwikilang and lang:, checked locally instead of
+# building an API client to find out; covers every Wikipedia with a sizeable article count
+_VALID_WIKI_LANGS = frozenset({
+    "af", "als", "am", "an", "ar", "arz", "as", "ast", "az", "azb", "ba", "bar", "be", "bg",
+    "bn", "bpy", "br", "bs", "ca", "ce", "ceb", "ckb", "cs", "cv", "cy", "da", "de", "el",
+    "en", "eo", "es", "et", "eu", "fa", "fi", "fo", "fr", "fy", "ga", "gd", "gl", "gu", "he",
+    "hi", "hr", "hsb", "ht", "hu", "hy", "ia", "id", "ilo", "io", "is", "it", "ja", "jv", "ka",
+    "kk", "kn", "ko", "ku", "ky", "la", "lb", "li", "lmo", "lt", "lv", "mai", "mg", "min", "mk",
+    "ml", "mn", "mr", "ms", "my", "mzn", "nap", "nds", "ne", "new", "nl", "nn", "no", "oc",
+    "or", "os", "pa", "pl", "pms", "pnb", "ps", "pt", "qu", "ro", "ru", "sa", "sah", "scn",
+    "sco", "sd", "sh", "si", "simple", "sk", "sl", "so", "sq", "sr", "su", "sv", "sw", "ta",
+    "te", "tg", "th", "tl", "tr", "tt", "uk", "ur", "uz", "vec", "vi", "vo", "wa", "war",
+    "wuu", "yi", "yo", "zh", "zh-min-nan", "zh-yue",
+})
+
+_WIKI_CACHE_SIZE = 50  # entries kept per user; least recently used are evicted first
+_PAGE_CACHE_SIZE = 256  # lookups shared across users, in front of the network
+_PAGE_CACHE_TTL = 3600  # seconds
+# Append-only log of per-user cache inserts, kept beside the memory file. Replayed on
+# load and rewritten once it holds more than twice the live entries
+_WIKI_LOG_FILE = "wiki_cache.ndjson"
+
+# (lowercase prefix, handler method), tried in order so "!wiki search " wins over "!wiki "
+_COMMAND_PREFIXES = (
+    ("!wiki search ", "_cmd_search"),
+    ("!setwikilang ", "_cmd_setwikilang"),
+    ("!wiki ", "_cmd_wiki"),
+)
+# Argument parsers, applied to the lowercased text after the prefix
+_WIKI_ARGS_RE = re.compile(r"(.+?)(?:\s+lang:([\w-]+))?(?:\s+section:([\w\s]+))?$")
+_LANG_CODE_RE = re.compile(r"[\w-]+")
 
 class Plugin:
     metadata = {
         "name": "Wikipedia Summarizer",
         "version": "2.0",
-        "description": "Fetches Wikipedia summaries, supports multiple languages, section queries, and disambiguation."
+        "description": "Fetches Wikipedia summaries, supports multiple languages, section queries, and disambiguation.",
+        "commands": ["wiki", "setwikilang"]
     }
 
     def __init__(self, bot):
         self.bot = bot
         self.default_language = "en"
-        self.cache_duration = timedelta(hours=24)
-        self.wiki_apis = {}  # Cache Wikipedia API instances by language
+        self.cache_duration = 24 * 3600  # seconds
+        # Cache Wikipedia API instances by language; the user agent is derived from the
+        # language, so it needs no place in the key
+        self.wiki_apis = {}
+        # (language, query, section) -> (monotonic time fetched, found, text), in LRU order
+        self._page_cache = {}
+        # user_id -> {cache_key: {"result", "timestamp"}} in LRU order, rebuilt from the log
+        self._user_caches = {}
+        self._log_path = os.path.join(os.path.dirname(bot.memory_file), _WIKI_LOG_FILE)
+        self._log = None
+        self._log_records = 0  # Lines in the log, live or superseded
+        self._log_lock = threading.Lock()
 
     def get_wiki_api(self, language):
         """Get or create Wikipedia API instance for a language"""
@@ -31,122 +81,229 @@ class Plugin:
 
     def set_user_language(self, user_id, language):
         """Set user's preferred Wikipedia language in memory"""
+        if language not in _VALID_WIKI_LANGS:
+            return False
         user_data = self.bot.memory["knowledge"]["users"].setdefault(user_id, {})
         try:
-            # Validate language by attempting to create API instance
-            wikipediaapi.Wikipedia(f"AIChatBot/2.0 ({language})", language)
+            # Create (and keep) the client now, so the first lookup doesn't have to
+            self.get_wiki_api(language)
             user_data["wiki_language"] = language
-            self.bot.save_memory()
+            self.bot.mark_dirty()
             return True
         except Exception:
             return False
 
     def get_cached_result(self, user_id, query, language):
         """Check for cached result in memory"""
-        user_data = self.bot.memory["knowledge"]["users"].get(user_id, {})
-        cache = user_data.get("wiki_cache", {})
+        cache = self._user_caches.get(user_id, {})
         cache_key = f"{language}:{query.lower()}"
         if cache_key in cache:
             entry = cache[cache_key]
-            cache_time = datetime.fromisoformat(entry["timestamp"])
-            if datetime.now() - cache_time < self.cache_duration:
+            if time.time() - entry["timestamp"] < self.cache_duration:
+                # Re-insert to mark it most recently used. Dicts keep insertion order, so
+                # the first key is always the eviction candidate
+                cache[cache_key] = cache.pop(cache_key)
                 return entry["result"]
         return None
 
     def cache_result(self, user_id, query, language, result):
-        """Cache result in memory"""
-        user_data = self.bot.memory["knowledge"]["users"].setdefault(user_id, {})
-        user_data.setdefault("wiki_cache", {})
+        """Cache result in memory and append it to the cache log"""
         cache_key = f"{language}:{query.lower()}"
-        user_data["wiki_cache"][cache_key] = {
-            "result": result,
-            "timestamp": datetime.now().isoformat()
-        }
-        # Limit cache size
-        if len(user_data["wiki_cache"]) > 50:
-            oldest_key = min(user_data["wiki_cache"], key=lambda k: user_data["wiki_cache"][k]["timestamp"])
-            del user_data["wiki_cache"][oldest_key]
-        self.bot.save_memory()
+        now = time.time()
+        self._put_entry(user_id, cache_key, result, now)
+        self._append_log({"uid": user_id, "k": cache_key, "r": result, "t": now})
+
+    def _put_entry(self, user_id, cache_key, result, timestamp):
+        cache = self._user_caches.setdefault(user_id, {})
+        cache.pop(cache_key, None)  # A refreshed entry moves to the most recent end
+        cache[cache_key] = {"result": result, "timestamp": timestamp}
+        # Limit cache size by dropping the least recently used entries
+        while len(cache) > _WIKI_CACHE_SIZE:
+            del cache[next(iter(cache))]
+
+    def _append_log(self, record):
+        with self._log_lock:
+            if self._log is None:
+                return
+            try:
+                self._log.write(dumps_bytes(record) + b"\n")
+                self._log_records += 1
+                if self._log_records > 2 * sum(len(cache) for cache in self._user_caches.values()):
+                    self._compact_log()
+            except OSError as e:
+                # Losing a cache entry only costs a refetch
+                logger.error(f"Error writing wiki cache log: {e}")
+
+    def _replay_log(self):
+        """Rebuild the per-user caches from the log; returns whether any line was unreadable"""
+        damaged = False
+        try:
+            with open(self._log_path, "rb") as f:
+                for line in f:
+                    try:
+                        record = loads(line)
+                        self._put_entry(record["uid"], record["k"], record["r"], record["t"])
+                    except (ValueError, KeyError, TypeError):
+                        damaged = True  # e.g. a line cut short by a crash mid-write
+                        continue
+                    self._log_records += 1
+        except FileNotFoundError:
+            pass
+        return damaged
+
+    def _compact_log(self):
+        """Rewrite the log with only the live, unexpired entries. Caller holds _log_lock"""
+        now = time.time()
+        lines = [
+            dumps_bytes({"uid": user_id, "k": cache_key, "r": entry["result"], "t": entry["timestamp"]}) + b"\n"
+            for user_id, cache in self._user_caches.items()
+            for cache_key, entry in cache.items()
+            if now - entry["timestamp"] < self.cache_duration
+        ]
+        # Write beside the log and swap it in, as save_memory does for the memory file
+        tmp_path = f"{self._log_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(lines))
+        if self._log is not None:
+            self._log.close()
+            # Unset until the reopen succeeds, so a failure below leaves appends disabled
+            # instead of writing to a closed file
+            self._log = None
+        os.replace(tmp_path, self._log_path)
+        self._log = open(self._log_path, "ab", buffering=0)
+        self._log_records = len(lines)
+
+    def _migrate_memory_cache(self):
+        """Move caches kept in the memory file, before the log existed, into the log"""
+        moved = False
+        for user_id, user_data in self.bot.memory["knowledge"]["users"].items():
+            cache = user_data.pop("wiki_cache", None)
+            if cache is None:
+                continue
+            moved = True
+            for cache_key, entry in cache.items():
+                cache_time = entry["timestamp"]
+                if isinstance(cache_time, str):
+                    # Entries saved before timestamps were epoch seconds hold a local ISO string
+                    cache_time = datetime.fromisoformat(cache_time).timestamp()
+                self._put_entry(user_id, cache_key, entry["result"], cache_time)
+        return moved
 
     def process(self, user_input, default_response):
         """Process user input for Wikipedia-related commands"""
-        user_id = self.bot.config["default_user_id"]
-        user_language = self.get_user_language(user_id)
-        user_input_lower = user_input.lower().strip()
-
-        # Command: !wiki <query> [lang:<language>] [section:<section>]
-        wiki_match = re.match(
-            r"^!wiki\s+(.+?)(?:\s+lang:([\w-]+))?(?:\s+section:([\w\s]+))?$",
-            user_input_lower
-        )
-        if wiki_match:
-            query = wiki_match.group(1).strip()
-            language = wiki_match.group(2) if wiki_match.group(2) else user_language
-            section = wiki_match.group(3).strip() if wiki_match.group(3) else None
-
-            # Check cache first
-            cached_result = self.get_cached_result(user_id, query, language)
-            if cached_result:
-                return f"[Cached] {cached_result}"
-
-            wiki_api = self.get_wiki_api(language)
-            page = wiki_api.page(query)
-
-            if not page.exists():
-                # Try to handle disambiguation
-                disambig_page = wiki_api.page(query + " (disambiguation)")
-                if disambig_page.exists():
-                    suggestions = [title for title in disambig_page.links.keys()][:5]
-                    return (
-                        f"No exact match for '{query}' in {language} Wikipedia. "
-                        f"Did you mean one of these? {', '.join(suggestions)} "
-                        "Try specifying one with !wiki <suggestion>."
-                    )
-                return f"Sorry, I couldn't find a Wikipedia page for '{query}' in {language} Wikipedia."
-
-            # Get specific section or summary
-            if section:
-                section_data = page.section_by_title(section)
-                if section_data:
-                    content = section_data.text
-                    # Limit to first 500 characters for brevity
-                    content = content[:500] + ("..." if len(content) > 500 else "")
-                    result = f"Section '{section}' of '{query}' ({language}):\n{content}"
-                else:
-                    return f"No section named '{section}' found in '{query}'."
-            else:
-                # Get first paragraph of summary
-                summary_paragraph = page.summary.split('\n')[0]
-                result = f"Summary for '{query}' ({language}):\n{summary_paragraph}"
+        user_input_lower = self.bot.lowered(user_input).strip()
+        # Route on the fixed prefix; a regex is only needed to split the arguments
+        for prefix, handler in _COMMAND_PREFIXES:
+            if user_input_lower.startswith(prefix):
+                args = user_input_lower[len(prefix):].strip()
+                if not args:
+                    return None
+                user_id = self.bot.config["default_user_id"]
+                return getattr(self, handler)(args, user_id, self.get_user_language(user_id))
+        return None
 
-            # Cache the result
-            self.cache_result(user_id, query, language, result)
-            return result
-
-        # Command: !setwikilang <language>
-        lang_match = re.match(r"^!setwikilang\s+([\w-]+)$", user_input_lower)
-        if lang_match:
-            language = lang_match.group(1)
-            if self.set_user_language(user_id, language):
-                return f"Wikipedia language set to {language}."
+    # Command: !wiki <query> [lang:<language>] [section:<section>]
+    def _cmd_wiki(self, args, user_id, user_language):
+        wiki_match = _WIKI_ARGS_RE.match(args)
+        if not wiki_match:
+            return None
+        query = wiki_match.group(1).strip()
+        language = wiki_match.group(2) if wiki_match.group(2) else user_language
+        section = wiki_match.group(3).strip() if wiki_match.group(3) else None
+        if language not in _VALID_WIKI_LANGS:
             return f"Invalid Wikipedia language: {language}. Try 'en', 'fr', 'de', etc."
 
-        # Command: !wiki search <query>
-        search_match = re.match(r"^!wiki search\s+(.+)$", user_input_lower)
-        if search_match:
-            query = search_match.group(1).strip()
-            wiki_api = self.get_wiki_api(user_language)
-            search_results = wiki_api.search(query, results=5)
-            if not search_results:
-                return f"No search results found for '{query}' in {user_language} Wikipedia."
-            response_lines = [f"Search results for '{query}' ({user_language}):"]
-            response_lines.extend([f"- {result}" for result in search_results])
-            return "\n".join(response_lines)
+        # Check cache first
+        cached_result = self.get_cached_result(user_id, query, language)
+        if cached_result:
+            return f"[Cached] {cached_result}"
 
-        return None
+        found, result = self._fetch_summary(language, query, section)
+        if found:
+            self.cache_result(user_id, query, language, result)
+        return result
+
+    def _fetch_summary(self, language, query, section):
+        """Return (found, text) for a lookup, from the shared page cache when fresh"""
+        key = (language, query, section)
+        now = time.monotonic()
+        cached = self._page_cache.pop(key, None)
+        if cached and now - cached[0] < _PAGE_CACHE_TTL:
+            self._page_cache[key] = cached  # Back to the most recently used end
+            return cached[1], cached[2]
+
+        found, text = self._fetch_page(language, query, section)
+        self._page_cache[key] = (now, found, text)
+        while len(self._page_cache) > _PAGE_CACHE_SIZE:
+            del self._page_cache[next(iter(self._page_cache))]
+        return found, text
+
+    def _fetch_page(self, language, query, section):
+        wiki_api = self.get_wiki_api(language)
+        page = wiki_api.page(query)
+
+        if not page.exists():
+            # Try to handle disambiguation
+            disambig_page = wiki_api.page(query + " (disambiguation)")
+            if disambig_page.exists():
+                # links is fetched on first access; take the first few without copying them all
+                links = disambig_page.links
+                suggestions = list(islice(links, 5))
+                return False, (
+                    f"No exact match for '{query}' in {language} Wikipedia. "
+                    f"Did you mean one of these? {', '.join(suggestions)} "
+                    "Try specifying one with !wiki <suggestion>."
+                )
+            return False, f"Sorry, I couldn't find a Wikipedia page for '{query}' in {language} Wikipedia."
+
+        # Get specific section or summary
+        if section:
+            section_data = page.section_by_title(section)
+            if section_data:
+                content = section_data.text
+                # Limit to first 500 characters for brevity
+                content = content[:500] + ("..." if len(content) > 500 else "")
+                return True, f"Section '{section}' of '{query}' ({language}):\n{content}"
+            return False, f"No section named '{section}' found in '{query}'."
+        # Get first paragraph of summary
+        summary_paragraph = page.summary.split('\n')[0]
+        return True, f"Summary for '{query}' ({language}):\n{summary_paragraph}"
+
+    # Command: !setwikilang <language>
+    def _cmd_setwikilang(self, args, user_id, user_language):
+        if not _LANG_CODE_RE.fullmatch(args):
+            return None
+        language = args
+        if self.set_user_language(user_id, language):
+            return f"Wikipedia language set to {language}."
+        return f"Invalid Wikipedia language: {language}. Try 'en', 'fr', 'de', etc."
+
+    # Command: !wiki search <query>
+    def _cmd_search(self, args, user_id, user_language):
+        query = args
+        wiki_api = self.get_wiki_api(user_language)
+        search_results = wiki_api.search(query, results=5)
+        if not search_results:
+            return f"No search results found for '{query}' in {user_language} Wikipedia."
+        response_lines = [f"Search results for '{query}' ({user_language}):"]
+        response_lines.extend([f"- {result}" for result in search_results])
+        return "\n".join(response_lines)
 
     def on_load(self):
         """Called when plugin is loaded"""
+        damaged = self._replay_log()
+        with self._log_lock:
+            try:
+                migrated = self._migrate_memory_cache()
+                if migrated:
+                    self.bot.mark_dirty()
+                # Rewrite rather than append after a damaged line, so new records start clean
+                if migrated or damaged:
+                    self._compact_log()
+                else:
+                    self._log = open(self._log_path, "ab", buffering=0)
+            except OSError as e:
+                logger.error(f"Error opening wiki cache log: {e}")
         self.bot.command_registry.register(
             "wiki_help",
             lambda bot, args: (
@@ -164,4 +321,8 @@ class Plugin:
 
     def on_unload(self):
         """Called when plugin is unloaded"""
-        pass
\ No newline at end of file
+        with self._log_lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+        self.bot.flush_memory(force=True)
\ No newline at end of file
@@ -2,32 +2,54 @@
 import pytest
 import os
 import json
+from datetime import datetime, timezone
+import database
 from core import AIChatBot
 
-@pytest.fixture
-def bot(tmp_path):
+@pytest.fixture(scope="module")
+def bot(tmp_path_factory):
     """
     This is a pytest fixture.
-    It creates a fresh, isolated instance of our bot for each test function.
-    'tmp_path' is a special pytest fixture that provides a temporary directory.
+    It creates one isolated instance of our bot per test module, since loading every
+    plugin is the slow part; _reset below wipes what each test learned.
+    'tmp_path_factory' is the module-friendly version of pytest's 'tmp_path'.
     """
+    tmp_path = tmp_path_factory.mktemp("bot")
     # Create temporary files for config and memory so we don't mess with our real ones
     config_path = tmp_path / "config.json"
     memory_path = tmp_path / "chat_memory.json"
+    db_path = tmp_path / "chatbot_data.db"
     plugin_dir = "plugins" # Assume plugins are in the standard directory relative to tests
 
     config_data = {
         "memory_file": str(memory_path),
+        "db_file": str(db_path),
         "plugin_dir": plugin_dir,
         "default_user_id": "test_user"
     }
     with open(config_path, 'w') as f:
         json.dump(config_data, f)
     
-    # Yield the bot instance for the test to use
-    yield AIChatBot(config_file=str(config_path))
+    # Yield the bot instance for the tests to use
+    instance = AIChatBot(config_file=str(config_path))
+    yield instance
     
-    # Teardown (cleanup) happens automatically after the test runs
+    # Teardown: stop background work and close the database before the next module
+    instance.shutdown()
+
+@pytest.fixture(autouse=True)
+def _reset(bot):
+    """Give every test an empty memory, as if the bot had just been created."""
+    yield
+    bot.memory["knowledge"]["users"].clear()
+    bot.memory["conversations"].clear()
+
+@pytest.fixture
+def fresh_db(bot, tmp_path):
+    """Point the database at an empty file for one test, then back at the bot's own."""
+    database.init_db(str(tmp_path / "fresh.db"))
+    yield
+    database.init_db(bot.config["db_file"])
 
 def test_bot_initialization(bot):
     """Test if the bot and its components are created successfully."""
@@ -57,4 +79,107 @@ def test_plugin_loading(bot):
     # Check if a known, essential plugin was loaded
     assert "todo_plugin" in bot.plugin_manager.plugins
     assert "calculator_plugin" in bot.plugin_manager.plugins
-    assert "assistant_plugin" in bot.plugin_manager.plugins
\ No newline at end of file
+    assert "assistant_plugin" in bot.plugin_manager.plugins
+
+def test_legacy_conversations_migrate_to_database(tmp_path, fresh_db):
+    """Conversations kept inline in an old memory file are moved into the database, once."""
+    now = datetime.now(timezone.utc).isoformat()
+    legacy_memory = {
+        "conversations": [
+            {"user_id": "test_user", "input": "hi", "timestamp": now},
+            {"user_id": "bot", "input": "Hello there!", "timestamp": now},
+        ],
+        "knowledge": {"users": {"test_user": {"name": "Alice"}}},
+    }
+    memory_path = tmp_path / "legacy_memory.json"
+    memory_path.write_text(json.dumps(legacy_memory))
+    config_path = tmp_path / "legacy_config.json"
+    config_path.write_text(json.dumps({
+        "memory_file": str(memory_path),
+        "db_file": str(tmp_path / "legacy.db"),
+        "plugin_dir": str(tmp_path / "no_plugins"),  # Empty, so no plugins are loaded
+        "default_user_id": "test_user",
+    }))
+
+    for _ in range(2):  # The second start finds the rows already migrated
+        legacy_bot = AIChatBot(config_file=str(config_path))
+        try:
+            assert [conv["input"] for conv in legacy_bot.memory["conversations"]] == ["hi", "Hello there!"]
+            assert legacy_bot.memory["knowledge"]["users"]["test_user"]["name"] == "Alice"
+            rows = database.get_recent_conversations(10)
+            assert [(row["user_id"], row["role"], row["text"]) for row in rows] == [
+                ("test_user", "user", "hi"),
+                ("bot", "bot", "Hello there!"),
+            ]
+        finally:
+            legacy_bot.shutdown()
+
+def test_flush_after_shutdown_leaves_database_closed(tmp_path, fresh_db):
+    """A late flush or second shutdown (atexit) must not reopen the closed connection."""
+    config_path = tmp_path / "closed_config.json"
+    config_path.write_text(json.dumps({
+        "memory_file": str(tmp_path / "closed_memory.json"),
+        "db_file": str(tmp_path / "closed.db"),
+        "plugin_dir": str(tmp_path / "no_plugins"),
+        "default_user_id": "test_user",
+    }))
+    closed_bot = AIChatBot(config_file=str(config_path))
+    closed_bot.shutdown()
+    assert database._conn is None
+
+    closed_bot.flush_memory(force=True)
+    assert database._conn is None
+    closed_bot.shutdown()
+    assert database._conn is None
+
+def test_conversations_round_trip_through_database(fresh_db):
+    """Rows come back oldest first, limited to the most recent ones."""
+    rows = [
+        ("test_user", "user" if i % 2 == 0 else "bot", f"message {i}", f"2026-01-01T00:00:0{i}+00:00")
+        for i in range(5)
+    ]
+    assert database.add_conversations(rows)
+    recent = database.get_recent_conversations(3)
+    assert [(row["user_id"], row["role"], row["text"], row["ts"]) for row in recent] == rows[-3:]
+
+def test_prune_conversations_respects_cutoff_and_limit(fresh_db):
+    """Rows older than the cutoff go first, then all but the newest `keep`."""
+    database.add_conversations([
+        ("test_user", "user", f"message {day}", f"2026-01-0{day}T00:00:00+00:00") for day in range(1, 6)
+    ])
+    cutoff = "2026-01-03T00:00:00+00:00"
+
+    database.prune_conversations(cutoff, keep=10)
+    assert [row["text"] for row in database.get_recent_conversations(10)] == ["message 3", "message 4", "message 5"]
+
+    database.prune_conversations(cutoff, keep=2)
+    assert [row["text"] for row in database.get_recent_conversations(10)] == ["message 4", "message 5"]
+
+def test_flush_memory_bounds_conversation_table(bot, fresh_db, monkeypatch):
+    """The conversations table is trimmed to max_history rows, not only at startup."""
+    monkeypatch.setattr(bot, "max_history", 3)
+    for i in range(4):
+        bot.process_message(f"hello number {i}")
+    bot.flush_memory(force=True)
+    assert len(database.get_recent_conversations(100)) == 3
+
+def test_setname_command(bot):
+    """!setname stores the nickname for the current user."""
+    assert bot.process_message("!setname Mary Jane") == "Name set to Mary Jane"
+    assert bot.memory["knowledge"]["users"]["test_user"]["name"] == "Mary Jane"
+
+def test_facts_command(bot):
+    """!facts lists what the bot knows about the current user."""
+    bot.memory["knowledge"]["users"]["test_user"] = {"name": "Alice", "likes": ["swim", "read"]}
+    response = bot.process_message("!facts")
+    assert "Your name is Alice." in response
+    assert "You like to swim and read." in response
+    # Extra words used to be taken as the user id
+    assert bot.process_message("!facts please") == response
+
+def test_forget_command(bot):
+    """!forget removes one fact and says so when there is nothing to forget."""
+    bot.memory["knowledge"]["users"]["test_user"] = {"name": "Alice", "hobby": "chess"}
+    assert bot.process_message("!forget hobby") == "Okay, I forgot your hobby!"
+    assert bot.memory["knowledge"]["users"]["test_user"] == {"name": "Alice"}
+    assert bot.process_message("!forget hobby") == "I don't have a hobby for you."
\ No newline at end of file
@@ -1,10 +1,24 @@
 # tests/test_plugins.py
+import json
+import os
+import queue
+import socket
+import time
 import pytest
+import requests
+from datetime import datetime
+import pytz
 
 # We can reuse the same 'bot' fixture from test_core.py if it's in a conftest.py,
 # but for simplicity, we'll redefine it here. In a larger project, you'd use
 # a central tests/conftest.py file for shared fixtures.
-from tests.test_core import bot 
+from tests.test_core import bot, _reset
+from plugins.todo_plugin import _due_ts
+from plugins.datetime_plugin import _parse_schedule
+import plugins.wiki_plugin as wiki_plugin
+from plugins.wiki_plugin import Plugin as WikiPlugin
+from plugins.webhook_plugin import SPSCQueue
+from plugins.webhook_plugin import Plugin as WebhookPlugin
 
 def test_todo_plugin_add_and_list(bot):
     """Test adding a task and then listing it."""
@@ -49,4 +63,432 @@ def test_datetime_plugin_set_and_check_timezone(bot):
     
     # Ask for the time, which should now use the new timezone
     time_response = bot.process_message("!time")
-    assert "America/New_York" in time_response
\ No newline at end of file
+    assert "America/New_York" in time_response
+
+def test_todo_due_ts_migrates_legacy_due_date():
+    """Old ISO due dates convert to due_ts; unreadable ones are kept, not dropped."""
+    valid = {"task": "a", "due_date": "2026-01-02T03:04:05"}
+    expected = int(datetime(2026, 1, 2, 3, 4, 5).timestamp())
+    assert _due_ts(valid) == expected
+    assert valid == {"task": "a", "due_ts": expected}
+
+    malformed = {"task": "b", "due_date": "sometime soon"}
+    assert _due_ts(malformed) is None
+    assert malformed == {"task": "b", "due_date": "sometime soon"}
+
+    missing = {"task": "c"}
+    assert _due_ts(missing) is None
+    assert missing == {"task": "c"}
+
+@pytest.mark.parametrize("expression, expected", [
+    ("2 + 3 * 4", "14"),      # * before +
+    ("(2 + 3) * 4", "20"),    # parentheses first
+    ("2 * 3 ^ 2", "18"),      # ^ before *
+    ("10 - 4 - 3", "3"),      # left to right
+    ("8 / 4 / 2", "1"),
+    ("1.5 * 2", "3"),
+])
+def test_calculator_plugin_precedence(bot, expression, expected):
+    """Operators are applied in the usual order."""
+    response = bot.process_message(f"calculate {expression}")
+    assert response == f"The result of {expression} is {expected}."
+
+@pytest.mark.parametrize("expression, expected", [
+    ("-3 + 5", "2"),
+    ("2 * -3", "-6"),
+    ("-2 ^ 2", "-4"),         # ^ binds tighter than the minus
+    ("2 ^ -1", "0.5"),
+    ("-(3 + 2) * 2", "-10"),
+    ("5 - -3", "8"),
+])
+def test_calculator_plugin_unary_minus(bot, expression, expected):
+    """A minus with no left operand negates what follows."""
+    response = bot.process_message(f"calculate {expression}")
+    assert response == f"The result of {expression} is {expected}."
+
+def test_calculator_plugin_nested_functions(bot):
+    """Function calls nest inside each other and inside larger expressions."""
+    assert bot.process_message("calculate sqrt(abs(-16))") == "The result of sqrt(abs(-16)) is 4."
+    assert bot.process_message("calculate 2 * abs(sqrt(9) - 5)") == "The result of 2 * abs(sqrt(9) - 5) is 4."
+    assert bot.process_message("calculate sin(30) + cos(60)") == "The result of sin(30) + cos(60) is 1."
+
+@pytest.mark.parametrize("expression", [
+    "1 / 0",
+    "5 / (2 - 2)",
+])
+def test_calculator_plugin_division_by_zero(bot, expression):
+    """Dividing by zero is reported instead of raising."""
+    response = bot.process_message(f"calculate {expression}")
+    assert response == f"Sorry, I couldn't calculate '{expression}'. Please check your expression."
+
+@pytest.mark.parametrize("expression", [
+    "2 +",
+    "* 3",
+    "(2 + 3",
+    "2 + 3)",
+    "sqrt(-1)",
+    "sqrt 4",
+])
+def test_calculator_plugin_malformed_input(bot, expression):
+    """Incomplete or invalid expressions get the error reply."""
+    response = bot.process_message(f"calculate {expression}")
+    assert response.startswith(f"Sorry, I couldn't calculate '{expression}'.")
+
+@pytest.mark.parametrize("expression, expected", [
+    ("sqrt(16)+2", "6"),
+    ("2+sqrt(16)", "6"),
+    ("sqrt(16)*sqrt(4)", "8"),
+    ("abs(2-5)^2", "9"),
+    ("sqrt((3+1)*4)", "4"),
+])
+def test_calculator_plugin_function_calls(bot, expression, expected):
+    """A function's result takes part in the surrounding expression."""
+    response = bot.process_message(f"calculate {expression}")
+    assert response == f"The result of {expression} is {expected}."
+
+@pytest.mark.parametrize("expression", [
+    "foo(2)",
+    "log(100) + 1",
+    "2 + sqrtx(4)",
+])
+def test_calculator_plugin_unknown_function(bot, expression):
+    """Names that aren't supported functions are rejected."""
+    response = bot.process_message(f"calculate {expression}")
+    assert response == f"Sorry, I couldn't calculate '{expression}'. Please check your expression."
+
+@pytest.mark.parametrize("request_text, expected", [
+    ("Meeting at 2:30 pm", ("Meeting", "2:30 pm", None, None)),
+    # The last " at " starts the time, so the event may contain one
+    ("Dinner at Joe's at 7:30 pm", ("Dinner at Joe's", "7:30 pm", None, None)),
+    ("Look at at 9:00", ("Look at", "9:00", None, None)),
+    ("Meeting at 2:30 pm on 12/31/2025 in Europe/London", ("Meeting", "2:30 pm", "12/31/2025", "Europe/London")),
+    ("Call at 9:00 am in Asia/Tokyo", ("Call", "9:00 am", None, "Asia/Tokyo")),
+    ("Standup AT 9:15 am ON 01/02/2026", ("Standup", "9:15 am", "01/02/2026", None)),
+    # Keywords may be surrounded by any run of whitespace
+    ("Standup  at\t9:15 am   on  01/02/2026\tin America/New_York", ("Standup", "9:15 am", "01/02/2026", "America/New_York")),
+])
+def test_parse_schedule_fields(request_text, expected):
+    """Schedule requests split into (event, time, date, timezone)."""
+    assert _parse_schedule(request_text) == expected
+
+@pytest.mark.parametrize("request_text", [
+    "Meeting",                              # no time
+    "at 5:00",                              # no event
+    "Meeting at noon",                      # time not in H:MM form
+    "Meeting at 5:00 on tomorrow",          # date not MM/DD/YYYY
+    "Meeting at 5:00 in Europe/London!",    # not a timezone name
+    "Meeting at 5:00 in",                   # keyword without a value
+])
+def test_parse_schedule_rejects_invalid_requests(request_text):
+    """Anything that doesn't fit the schedule syntax is not a schedule request."""
+    assert _parse_schedule(request_text) is None
+
+@pytest.mark.parametrize("now, offset, expected", [
+    # Month boundary
+    (datetime(2026, 1, 31, 15, 0, tzinfo=pytz.UTC), "tomorrow", datetime(2026, 2, 1, 15, 0, tzinfo=pytz.UTC)),
+    (datetime(2026, 1, 31, 15, 0, tzinfo=pytz.UTC), "next week", datetime(2026, 2, 7, 15, 0, tzinfo=pytz.UTC)),
+    (datetime(2026, 1, 31, 15, 0, tzinfo=pytz.UTC), "in 2 days", datetime(2026, 2, 2, 15, 0, tzinfo=pytz.UTC)),
+    (datetime(2026, 1, 31, 23, 0, tzinfo=pytz.UTC), "in 3 hours", datetime(2026, 2, 1, 2, 0, tzinfo=pytz.UTC)),
+    (datetime(2026, 2, 20, 9, 30, tzinfo=pytz.UTC), "in 2 weeks", datetime(2026, 3, 6, 9, 30, tzinfo=pytz.UTC)),
+    # Year boundary
+    (datetime(2026, 12, 31, 12, 0, tzinfo=pytz.UTC), "Tomorrow", datetime(2027, 1, 1, 12, 0, tzinfo=pytz.UTC)),
+    (datetime(2026, 12, 28, 12, 0, tzinfo=pytz.UTC), "next week", datetime(2027, 1, 4, 12, 0, tzinfo=pytz.UTC)),
+    (datetime(2026, 1, 31, 15, 0, tzinfo=pytz.UTC), "12/25/2026", datetime(2026, 12, 25, tzinfo=pytz.UTC)),
+])
+def test_datetime_plugin_parse_date_offset(bot, now, offset, expected):
+    """Offsets resolve relative to the given "now"."""
+    plugin = bot.plugin_manager.plugins["datetime_plugin"]["instance"]
+    assert plugin.parse_date_offset(offset, now=now) == expected
+
+@pytest.mark.parametrize("offset", ["someday", "13/45/2026", "in two days"])
+def test_datetime_plugin_parse_date_offset_rejects(bot, offset):
+    """Unknown offsets and impossible dates give None."""
+    plugin = bot.plugin_manager.plugins["datetime_plugin"]["instance"]
+    assert plugin.parse_date_offset(offset, now=datetime(2026, 1, 31, tzinfo=pytz.UTC)) is None
+
+def _pending_titles(bot):
+    """Task titles shown by '!todo list pending', in order."""
+    response = bot.process_message("!todo list pending")
+    return [line.split(". ", 1)[1].split(" (Priority")[0] for line in response.splitlines()[1:]]
+
+def _add_tasks(bot, *tasks):
+    for task in tasks:
+        bot.process_message(f"!todo add {task}")
+
+def test_todo_pending_cache_follows_add(bot):
+    """A task added after the pending list was built shows up in it."""
+    _add_tasks(bot, "First")
+    assert _pending_titles(bot) == ["First"]
+    _add_tasks(bot, "Second")
+    assert _pending_titles(bot) == ["First", "Second"]
+
+def test_todo_pending_cache_follows_done(bot):
+    """Completed tasks leave the pending list, and numbering follows what is left."""
+    _add_tasks(bot, "First", "Second", "Third")
+    assert _pending_titles(bot) == ["First", "Second", "Third"]
+    assert "Completed: \"Second\"" in bot.process_message("!todo done 2")
+    assert _pending_titles(bot) == ["First", "Third"]
+    assert "Completed: \"Third\"" in bot.process_message("!todo done 2")
+    assert _pending_titles(bot) == ["First"]
+
+def test_todo_pending_cache_follows_remove(bot):
+    """Removing a task drops it from the pending list."""
+    _add_tasks(bot, "First", "Second")
+    assert _pending_titles(bot) == ["First", "Second"]
+    bot.process_message("!todo remove 1")
+    assert _pending_titles(bot) == ["Second"]
+    assert "Completed: \"Second\"" in bot.process_message("!todo done 1")
+
+@pytest.mark.parametrize("clear_command, remaining", [
+    ("!todo clear all", []),
+    ("!todo clear completed", ["Home chore"]),
+    ("!todo clear category:Work", ["Home chore"]),
+])
+def test_todo_pending_cache_follows_clear(bot, clear_command, remaining):
+    """Every kind of clear is reflected in the pending list."""
+    _add_tasks(bot, "Done already", "Work item category:Work", "Home chore")
+    bot.process_message("!todo done 1")
+    assert _pending_titles(bot) == ["Work item", "Home chore"]
+    if clear_command == "!todo clear completed":
+        bot.process_message("!todo done 1")  # Complete "Work item" so it is cleared too
+    bot.process_message(clear_command)
+    assert _pending_titles(bot) == remaining
+
+def test_todo_pending_cache_follows_outside_edits(bot):
+    """Edits made to the list by other code, in place or by replacing it, are picked up."""
+    _add_tasks(bot, "First", "Second")
+    assert _pending_titles(bot) == ["First", "Second"]
+    user_data = bot.memory["knowledge"]["users"]["test_user"]
+    user_data["todo_list"][:] = user_data["todo_list"][1:]  # Same list object, shorter
+    assert _pending_titles(bot) == ["Second"]
+    user_data["todo_list"] = []
+    _add_tasks(bot, "Third")
+    assert _pending_titles(bot) == ["Third"]
+
+def _wiki_plugin(bot, log_path):
+    """A wiki plugin instance whose cache log lives at log_path."""
+    plugin = WikiPlugin(bot)
+    plugin._log_path = str(log_path)
+    plugin.on_load()
+    return plugin
+
+def _log_lines(log_path):
+    return log_path.read_bytes().splitlines()
+
+def test_wiki_cache_log_replays_on_load(bot, tmp_path):
+    """Results cached by one instance are served by the next one from the log."""
+    log_path = tmp_path / "wiki_cache.ndjson"
+    plugin = _wiki_plugin(bot, log_path)
+    plugin.cache_result("test_user", "Python", "en", "Summary for 'python'")
+    plugin.cache_result("other_user", "Rust", "de", "Summary for 'rust'")
+    plugin.on_unload()
+
+    reloaded = _wiki_plugin(bot, log_path)
+    assert reloaded.get_cached_result("test_user", "python", "en") == "Summary for 'python'"
+    assert reloaded.get_cached_result("other_user", "rust", "de") == "Summary for 'rust'"
+    assert reloaded.get_cached_result("test_user", "rust", "de") is None
+    reloaded.on_unload()
+
+def test_wiki_cache_log_skips_truncated_line(bot, tmp_path):
+    """A line cut short by a crash is dropped and the log rewritten, so appends start clean."""
+    log_path = tmp_path / "wiki_cache.ndjson"
+    log_path.write_bytes(
+        json.dumps({"uid": "test_user", "k": "en:python", "r": "kept", "t": time.time()}).encode()
+        + b'\n{"uid": "test_user", "k": "en:ru'
+    )
+    plugin = _wiki_plugin(bot, log_path)
+    assert plugin.get_cached_result("test_user", "python", "en") == "kept"
+    assert len(_log_lines(log_path)) == 1
+
+    plugin.cache_result("test_user", "rust", "en", "added")
+    assert [json.loads(line)["r"] for line in _log_lines(log_path)] == ["kept", "added"]
+    plugin.on_unload()
+
+def test_wiki_cache_log_compacts_past_twice_the_live_entries(bot, tmp_path):
+    """Superseded records are dropped once the log holds more than twice the live entries."""
+    log_path = tmp_path / "wiki_cache.ndjson"
+    plugin = _wiki_plugin(bot, log_path)
+    plugin.cache_result("test_user", "python", "en", "v1")
+    plugin.cache_result("test_user", "python", "en", "v2")
+    assert len(_log_lines(log_path)) == 2  # Exactly twice the one live entry: kept as is
+
+    plugin.cache_result("test_user", "python", "en", "v3")
+    assert [json.loads(line)["r"] for line in _log_lines(log_path)] == ["v3"]
+    for version in range(4, 20):
+        plugin.cache_result("test_user", "python", "en", f"v{version}")
+        assert len(_log_lines(log_path)) <= 2
+    plugin.on_unload()
+
+def test_wiki_cache_migrates_from_memory_file(bot, tmp_path):
+    """Caches stored in the memory file by older versions move into the log."""
+    bot.memory["knowledge"]["users"]["test_user"] = {
+        "name": "Alice",
+        "wiki_cache": {"en:python": {"result": "old summary", "timestamp": datetime.now().isoformat()}},
+    }
+    log_path = tmp_path / "wiki_cache.ndjson"
+    plugin = _wiki_plugin(bot, log_path)
+    assert bot.memory["knowledge"]["users"]["test_user"] == {"name": "Alice"}
+    assert plugin.get_cached_result("test_user", "python", "en") == "old summary"
+    [record] = [json.loads(line) for line in _log_lines(log_path)]
+    assert record["uid"] == "test_user" and record["k"] == "en:python"
+    assert isinstance(record["t"], float)
+    plugin.on_unload()
+
+def test_wiki_cache_survives_failed_compaction(bot, tmp_path, monkeypatch):
+    """If compaction can't swap the log in, caching keeps working without raising."""
+    log_path = tmp_path / "wiki_cache.ndjson"
+    plugin = _wiki_plugin(bot, log_path)
+
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, "replace", failing_replace)
+    for version in range(5):
+        plugin.cache_result("test_user", "python", "en", f"v{version}")
+    assert plugin.get_cached_result("test_user", "python", "en") == "v4"
+    plugin.on_unload()
+
+def test_webhook_queue_put_and_get():
+    """Items come out in order, and an empty queue raises queue.Empty like queue.Queue."""
+    webhook_queue = SPSCQueue()
+    assert webhook_queue.empty()
+    with pytest.raises(queue.Empty):
+        webhook_queue.get_nowait()
+
+    webhook_queue.put_nowait("first")
+    webhook_queue.put("second")
+    assert webhook_queue.qsize() == 2 and not webhook_queue.empty()
+    assert webhook_queue.get_nowait() == "first"
+    assert webhook_queue.get_nowait() == "second"
+    with pytest.raises(queue.Empty):
+        webhook_queue.get_nowait()
+
+def test_webhook_queue_drops_oldest_when_full():
+    """Past maxlen the oldest items give way, so an unread queue stays bounded."""
+    webhook_queue = SPSCQueue(maxlen=3)
+    for item in range(5):
+        webhook_queue.put_nowait(item)
+    assert webhook_queue.qsize() == 3
+    assert [webhook_queue.get_nowait() for _ in range(3)] == [2, 3, 4]
+    assert webhook_queue.empty()
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _start_webhook(bot, port):
+    plugin = WebhookPlugin(bot)
+    plugin.host, plugin.port = "127.0.0.1", port
+    plugin.on_load()
+    deadline = time.monotonic() + 5
+    while not (plugin._server is not None and plugin._server.started):
+        assert plugin._server_thread.is_alive() and time.monotonic() < deadline
+        time.sleep(0.01)
+    return plugin
+
+def test_webhook_reload_rebinds_port(bot, monkeypatch):
+    """Unloading waits for the server to stop, so a reloaded plugin can take the same port.
+
+    The reloaded instance also keeps the queue and consumer wired to the first one.
+    """
+    wakeups = []
+    webhook_queue = SPSCQueue()
+    monkeypatch.setitem(bot.services, "webhook", {"queue": webhook_queue, "on_message": None})
+    port = _free_port()
+    old = _start_webhook(bot, port)
+    bot.services["webhook"]["on_message"] = lambda: wakeups.append(1)
+    old.on_unload()
+    assert not old._server_thread.is_alive()
+
+    new = _start_webhook(bot, port)
+    try:
+        response = requests.post(f"http://127.0.0.1:{port}/webhook", json={"movie": {"title": "Heat"}}, timeout=5)
+        assert response.status_code == 200
+        assert webhook_queue.get_nowait() == "🔌 Radarr: Downloaded 'Heat'"
+        assert wakeups == [1]
+    finally:
+        new.on_unload()
+
+def _wait_for_joke_prefetch(plugin):
+    assert plugin._prefetching.acquire(timeout=5)
+    plugin._prefetching.release()
+
+def test_joke_plugin_cold_queue_fetches_one_batch(bot, monkeypatch):
+    """The first !joke answers synchronously, then fetches only the rest of a batch."""
+    plugin = bot.plugin_manager.plugins["joke_plugin"]["instance"]
+    calls = []
+    def fake_fetch():
+        calls.append(1)
+        return f"joke {len(calls)}"
+    monkeypatch.setattr(plugin, "_fetch_joke", fake_fetch)
+    monkeypatch.setattr(plugin, "_jokes", queue.Queue(maxsize=5))
+
+    assert bot.process_message("!joke") == "joke 1"
+    _wait_for_joke_prefetch(plugin)
+    assert len(calls) == 5  # The joke told plus four fetched ahead
+    assert plugin._jokes.qsize() == 4
+
+    assert bot.process_message("!joke") == "joke 2"
+    _wait_for_joke_prefetch(plugin)
+    assert plugin._jokes.qsize() == 5
+
+def test_joke_plugin_failed_fetch_skips_prefetch(bot, monkeypatch):
+    """When the API is down, nothing is fetched ahead behind the error reply."""
+    plugin = bot.plugin_manager.plugins["joke_plugin"]["instance"]
+    calls = []
+    def failing_fetch():
+        calls.append(1)
+        raise requests.exceptions.ConnectionError("offline")
+    monkeypatch.setattr(plugin, "_fetch_joke", failing_fetch)
+    monkeypatch.setattr(plugin, "_jokes", queue.Queue(maxsize=5))
+
+    assert bot.process_message("!joke").startswith("Sorry, I couldn't fetch a joke right now.")
+    _wait_for_joke_prefetch(plugin)
+    assert len(calls) == 1
+
+def test_notes_plugin_list_by_category(bot):
+    """'!note list category:<name>' shows only that category's notes, matched case-insensitively."""
+    bot.process_message("!note add Buy milk title:Groceries category:Home")
+    bot.process_message("!note add Ship the release title:Release category:Work")
+    bot.process_message("!note add Book review title:Review category:Work")
+
+    response = bot.process_message("!note list category:work")
+    assert response.startswith("Your Notes (category work):")
+    assert "Release" in response and "Review" in response
+    assert "Groceries" not in response
+
+    assert bot.process_message("!note list category:Garden") == "No notes found for category: Garden."
+
+class _FakeWikiPage:
+    summary = "Foo is a placeholder name.\nMore text."
+    def exists(self):
+        return True
+
+class _FakeWikipedia:
+    """Stands in for wikipediaapi.Wikipedia and records what was asked."""
+    calls = []
+    def __init__(self, user_agent, language):
+        self.language = language
+    def search(self, query, results=5):
+        self.calls.append(("search", query))
+        return ["Foo", "Foobar"]
+    def page(self, title):
+        self.calls.append(("page", title))
+        return _FakeWikiPage()
+
+def test_wiki_search_reaches_search_command(bot, monkeypatch):
+    """'!wiki search <query>' runs a search instead of being read as a '!wiki' lookup."""
+    monkeypatch.setattr(wiki_plugin.wikipediaapi, "Wikipedia", _FakeWikipedia)
+    monkeypatch.setattr(_FakeWikipedia, "calls", [])
+    plugin = bot.plugin_manager.plugins["wiki_plugin"]["instance"]
+    monkeypatch.setattr(plugin, "wiki_apis", {})
+    monkeypatch.setattr(plugin, "_page_cache", {})
+    monkeypatch.setattr(plugin, "_user_caches", {})
+
+    response = bot.process_message("!wiki search foo")
+    assert response == "Search results for 'foo' (en):\n- Foo\n- Foobar"
+    assert _FakeWikipedia.calls == [("search", "foo")]
+
+    response = bot.process_message("!wiki foo")
+    assert response == "Summary for 'foo' (en):\nFoo is a placeholder name."
+    assert _FakeWikipedia.calls == [("search", "foo"), ("page", "foo")]
\ No newline at end of file
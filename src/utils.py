@@ -1,6 +1,16 @@
 # utils.py
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+
+# orjson is optional; it is several times faster than json and produces UTF-8 bytes directly
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # --- NEW CODE START ---
 # Get the absolute path of the directory where this file is located (i.e., your src folder)
@@ -10,16 +20,41 @@ log_file_path = os.path.join(base_dir, 'chatbot.log')
 # --- NEW CODE END ---
 
 
-# Configure logging for the entire application
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] [%(name)s] %(message)s',
-    handlers=[
-        # Use the new absolute path for the FileHandler
-        logging.FileHandler(log_file_path),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging for the entire application. The QueueHandler still formats the message
+# (and any traceback) on the calling thread; the listener thread then does the final
+# formatting and the file/console writes, so log calls never block on I/O
+_log_formatter = logging.Formatter('%(asctime)s [%(levelname)s] [%(name)s] %(message)s')
+_log_handlers = [
+    # Use the new absolute path for the FileHandler
+    logging.FileHandler(log_file_path),
+    logging.StreamHandler()
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+
+_log_queue = queue.Queue(-1)
+_root_logger = logging.getLogger()
+_root_logger.setLevel(logging.INFO)
+_root_logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers, respect_handler_level=True)
+_log_listener.start()
+# Registered before anything else, so it runs last at exit and drains every record
+atexit.register(_log_listener.stop)
+
+def dumps_bytes(obj, indent=False):
+    """Serialize obj to UTF-8 JSON bytes. Both backends accept non-string keys, and values
+    json can't encode natively (datetimes, sets) fall back to str() instead of raising."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=str, option=option)
+    return json.dumps(obj, indent=2 if indent else None, default=str).encode()
+
+# (connect, read) timeout in seconds for plugin HTTP calls made through bot.http. With the
+# session's retries an unreachable host costs about 6 s and a stalled one 5 s
+HTTP_TIMEOUT = (3, 5)
+
+# Parses str or bytes
+loads = orjson.loads if orjson is not None else json.loads
 
 # Default configuration for the bot
 DEFAULT_CONFIG = {
@@ -27,5 +62,7 @@ DEFAULT_CONFIG = {
     "plugin_dir": "plugins",
     "max_history": 100,
     "history_days": 7,
+    "save_interval": 60,
+    "db_file": "chatbot_data.db",
     "default_user_id": "default"
 }
\ No newline at end of file